@@ -66,6 +66,8 @@ with st.sidebar:
         with col_sub:
             if st.button("• Conciliación Bancaria", key="nav_conciliacion", use_container_width=True):
                 st.switch_page("pages/Conciliacion_bancaria.py")
+            if st.button("• Conciliación por Lotes", key="nav_conciliacion_lote", use_container_width=True):
+                st.switch_page("pages/Conciliacion_bancaria_lote.py")
 
     # ===== SECCIÓN: IMPUESTOS =====
     st.markdown("**IMPUESTOS**")
@@ -149,7 +151,7 @@ if selected == 'Inicio':
         st.warning("""
         **✅ Conciliaciones**
         - Conciliación Bancaria
-
+        - Conciliación por Lotes
 
         
         """)
@@ -0,0 +1,243 @@
+import contextlib
+import json
+import os
+import sqlite3
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# ==========================================================
+# 🗄️ ALMACÉN LOCAL DE PARTIDAS PENDIENTES
+# ==========================================================
+# Guarda en SQLite las partidas que quedan sin conciliar en cada cuenta y
+# periodo (AAAA-MM) para arrastrarlas a los meses siguientes. Una partida
+# está abierta mientras 'periodo_cierre' sea NULL; el índice parcial de
+# abiertas cubre solo esas filas, así que la consulta del arrastre no crece
+# con el histórico de partidas ya cerradas.
+
+DIRECTORIO_DATOS = os.environ.get("MOMA_TOOLS_DATA", "datos_locales")
+RUTA_ALMACEN = os.path.join(DIRECTORIO_DATOS, "conciliaciones.sqlite3")
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS partidas (
+    id INTEGER PRIMARY KEY,
+    cuenta TEXT NOT NULL,
+    periodo TEXT NOT NULL,
+    origen TEXT NOT NULL CHECK (origen IN ('contabilidad', 'banco')),
+    fecha TEXT,
+    descripcion TEXT,
+    monto_centavos INTEGER NOT NULL,
+    periodo_cierre TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_partidas_abiertas
+    ON partidas (cuenta, periodo) WHERE periodo_cierre IS NULL;
+CREATE INDEX IF NOT EXISTS ix_partidas_periodo ON partidas (cuenta, periodo);
+CREATE INDEX IF NOT EXISTS ix_partidas_cierre ON partidas (cuenta, periodo_cierre);
+"""
+
+COLUMNAS_PARTIDA = ["fecha", "descripcion", "centavos"]
+
+
+def conectar(ruta=None):
+    """Abre (y crea si hace falta) el almacén SQLite."""
+    ruta = ruta or RUTA_ALMACEN
+    directorio = os.path.dirname(ruta)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    con = sqlite3.connect(ruta, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript(ESQUEMA)
+    return con
+
+
+def periodo_de_fecha(fecha):
+    """Periodo 'AAAA-MM' de una fecha, o None si no hay fecha."""
+    if fecha is None or pd.isna(fecha):
+        return None
+    return pd.Timestamp(fecha).strftime("%Y-%m")
+
+
+def cargar_abiertas(con, cuenta, periodo):
+    """
+    Partidas de la cuenta originadas antes de 'periodo' que seguían abiertas al
+    empezar 'periodo': las aún abiertas y las cerradas en 'periodo' o después.
+    Devuelve (contabilidad, banco): DataFrames fecha/descripcion/centavos
+    indexados con el id negativo de la partida, para no chocar con los índices
+    de los movimientos nuevos.
+    """
+    # Las cerradas en este periodo o después cuentan como abiertas: se está reprocesando el mes
+    consulta = (
+        "SELECT id, origen, fecha, descripcion, monto_centavos, periodo FROM partidas "
+        "WHERE cuenta = ? AND periodo_cierre IS NULL AND periodo < ? "
+        "UNION ALL "
+        "SELECT id, origen, fecha, descripcion, monto_centavos, periodo FROM partidas "
+        "WHERE cuenta = ? AND periodo_cierre >= ? AND periodo < ?"
+    )
+    df = pd.read_sql_query(consulta, con, params=(cuenta, periodo, cuenta, periodo, periodo))
+    df.index = -df.pop("id")
+    df["fecha"] = pd.to_datetime(df["fecha"], errors="coerce")
+    df["descripcion"] = df["descripcion"].astype(str).astype("category")
+    df["centavos"] = df.pop("monto_centavos").astype("int64")
+    contab = df.loc[df["origen"] == "contabilidad", COLUMNAS_PARTIDA]
+    banco = df.loc[df["origen"] == "banco", COLUMNAS_PARTIDA]
+    return contab, banco
+
+
+def periodo_posterior(con, cuenta, periodo):
+    """
+    Último periodo de la cuenta posterior a 'periodo' que ya dejó rastro en el
+    almacén (partidas registradas o cerradas en él), o None si no hay.
+    """
+    fila = con.execute(
+        "SELECT MAX(p) FROM ("
+        "SELECT MAX(periodo) AS p FROM partidas WHERE cuenta = ? AND periodo > ? "
+        "UNION ALL "
+        "SELECT MAX(periodo_cierre) FROM partidas WHERE cuenta = ? AND periodo_cierre > ?)",
+        (cuenta, periodo, cuenta, periodo)
+    ).fetchone()
+    return fila[0]
+
+
+def registrar_periodo(con, cuenta, periodo, ids_cerradas, pendientes_contab, pendientes_banco):
+    """
+    Registra el resultado de la conciliación de (cuenta, periodo) en una sola
+    transacción: cierra las partidas arrastradas que se conciliaron y guarda
+    como abiertas las partidas nuevas que quedaron pendientes.
+
+    Antes deshace lo registrado para el mismo (cuenta, periodo), así
+    reprocesar un mes no duplica partidas. Si un periodo posterior ya se apoyó
+    en este (periodo_posterior), deshacerlo reabriría partidas que ese periodo
+    cerró: se lanza ValueError y no se modifica nada.
+    """
+    filas = []
+    for origen, df in (("contabilidad", pendientes_contab), ("banco", pendientes_banco)):
+        if df.empty:
+            continue
+        fechas = pd.to_datetime(df["fecha"], errors="coerce").dt.strftime("%Y-%m-%d")
+        filas.extend(zip(
+            [cuenta] * len(df), [periodo] * len(df), [origen] * len(df),
+            [f if isinstance(f, str) else None for f in fechas],
+            df["descripcion"].astype(str).tolist(), df["centavos"].tolist()
+        ))
+
+    with con:
+        posterior = periodo_posterior(con, cuenta, periodo)
+        if posterior is not None:
+            raise ValueError(
+                f"La cuenta {cuenta} ya tiene registrado el periodo {posterior}, posterior a {periodo}"
+            )
+        con.execute("DELETE FROM partidas WHERE cuenta = ? AND periodo = ?", (cuenta, periodo))
+        con.execute(
+            "UPDATE partidas SET periodo_cierre = NULL WHERE cuenta = ? AND periodo_cierre = ?",
+            (cuenta, periodo)
+        )
+        con.executemany(
+            "UPDATE partidas SET periodo_cierre = ? WHERE id = ? AND cuenta = ?",
+            [(periodo, int(i), cuenta) for i in ids_cerradas]
+        )
+        con.executemany(
+            "INSERT INTO partidas (cuenta, periodo, origen, fecha, descripcion, monto_centavos) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            filas
+        )
+
+
+# ==========================================================
+# 🧾 REGISTRO DE PERFILES DE EXTRACTOS
+# ==========================================================
+# Un perfil guarda, por firma de encabezado (nombres de columna normalizados),
+# la fila del encabezado y qué columna es fecha, descripción y monto. Es un
+# JSON legible: si un perfil quedó mal, se corrige o se borra a mano.
+
+RUTA_PERFILES = os.path.join(DIRECTORIO_DATOS, "perfiles_extracto.json")
+
+
+def _cargar_json(ruta):
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _escribir_json(ruta, datos):
+    """Escribe en un temporal y lo renombra, así un lector nunca ve el archivo a medias."""
+    directorio = os.path.dirname(ruta)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(datos, f, ensure_ascii=False, indent=2)
+    os.replace(temporal, ruta)
+
+
+@contextlib.contextmanager
+def _bloqueo(ruta):
+    """
+    Bloqueo exclusivo entre procesos sobre '<ruta>.lock' para leer, modificar
+    y escribir un registro JSON sin perder lo que otro proceso guarde a la vez.
+    """
+    directorio = os.path.dirname(ruta)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    with open(f"{ruta}.lock", "a+b") as candado:
+        if fcntl:
+            fcntl.flock(candado, fcntl.LOCK_EX)
+        else:
+            candado.seek(0)
+            msvcrt.locking(candado.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(candado, fcntl.LOCK_UN)
+            else:
+                candado.seek(0)
+                msvcrt.locking(candado.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def cargar_perfiles(ruta=None):
+    """Perfiles registrados {firma: perfil}; vacío si aún no hay registro."""
+    return _cargar_json(ruta or RUTA_PERFILES)
+
+
+def guardar_perfil(firma, perfil, ruta=None):
+    """
+    Agrega o reemplaza un perfil. Lee, modifica y escribe bajo _bloqueo: los
+    procesos de un lote que detectan formatos nuevos a la vez no se pisan.
+    """
+    ruta = ruta or RUTA_PERFILES
+    with _bloqueo(ruta):
+        perfiles = cargar_perfiles(ruta)
+        perfiles[firma] = perfil
+        _escribir_json(ruta, perfiles)
+
+
+# ==========================================================
+# 👥 REGISTRO DE TERCEROS (PERSONA JURÍDICA / NATURAL)
+# ==========================================================
+# Decisiones PJ/PN ya tomadas por identificación del tercero, para que los
+# proveedores que se repiten entre empresas y meses no vuelvan a pasar por los
+# patrones de nombre. Como los perfiles, es un JSON que se corrige a mano.
+
+RUTA_TERCEROS = os.path.join(DIRECTORIO_DATOS, "terceros_retefuente.json")
+
+
+def cargar_terceros(ruta=None):
+    """Decisiones registradas {identificación: "PJ" | "PN"}."""
+    return _cargar_json(ruta or RUTA_TERCEROS)
+
+
+def guardar_terceros(terceros, ruta=None):
+    """
+    Agrega o reemplaza decisiones. Relee el registro bajo _bloqueo antes de
+    escribir, así conserva las que otra sesión haya guardado entre tanto.
+    """
+    ruta = ruta or RUTA_TERCEROS
+    with _bloqueo(ruta):
+        registrados = cargar_terceros(ruta)
+        registrados.update(terceros)
+        _escribir_json(ruta, registrados)
@@ -0,0 +1,281 @@
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import subprocess
+import time
+import numpy as np
+import pandas as pd
+import xlsxwriter
+from almacen_utils import DIRECTORIO_DATOS
+from conciliacion_utils import (
+    OPCIONES_CONCILIACION, archivo_en_memoria, cargar_auxiliar_contable, cargar_extracto, limpiar_columna,
+    parsear_fechas, normalizar_contabilidad, emparejar_partidas, clasificar_partidas,
+    calcular_saldo_contable, generar_excel_conciliacion
+)
+
+# ==========================================================
+# ⏱️ BENCHMARK DE LA CONCILIACIÓN BANCARIA
+# ==========================================================
+# Genera auxiliares contables y extractos sintéticos de varios tamaños, mide
+# por separado cada etapa de la conciliación y agrega los tiempos a un JSONL
+# para comparar contra las corridas anteriores. Uso:
+#
+#   python benchmark_conciliacion.py --tamanos 1000,10000,100000
+#   python benchmark_conciliacion.py --tamanos 1000000 --disenos unico --formato csv
+
+DIRECTORIO_BENCHMARK = os.path.join(DIRECTORIO_DATOS, "benchmark")
+RUTA_RESULTADOS = os.path.join(DIRECTORIO_DATOS, "benchmark_conciliacion.jsonl")
+
+ENCABEZADO_CONTABLE = [
+    "Código contable", "Cuenta bancaria", "Fecha", "Comprobante", "Tercero", "Débito", "Crédito", "Saldo movimiento"
+]
+DISENOS_EXTRACTO = ("unico", "debito_credito")
+
+
+# ==========================================================
+# 🧪 GENERADORES DE ARCHIVOS SINTÉTICOS
+# ==========================================================
+def generar_movimientos(filas, semilla=0):
+    """
+    Movimientos contables sintéticos de un mes: fecha, comprobante, tercero
+    (con NIT), débito y crédito. Los montos se repiten como en la práctica
+    (pagos de nómina, cuotas), así el emparejamiento tiene grupos de montos iguales.
+    """
+    rng = np.random.default_rng(semilla)
+    terceros = max(filas // 20, 10)
+    id_tercero = rng.integers(0, terceros, filas)
+    montos = rng.choice(rng.integers(1, 5000, max(filas // 3, 10)) * 1000.0, filas)
+    es_debito = rng.random(filas) < 0.45
+    tipo = np.where(es_debito, "RC", "CE")
+    return pd.DataFrame({
+        "fecha": pd.Timestamp("2024-03-01") + pd.to_timedelta(rng.integers(0, 31, filas), unit="D"),
+        "comprobante": pd.Series(tipo).str.cat(pd.Series(np.arange(1, filas + 1)).astype(str), sep="-"),
+        "tercero": "TERCERO " + pd.Series(id_tercero).astype(str) + " SAS NIT " + pd.Series(800000000 + id_tercero).astype(str),
+        "debito": np.where(es_debito, montos, 0.0),
+        "credito": np.where(es_debito, 0.0, montos),
+    })
+
+
+def escribir_auxiliar(movimientos, ruta):
+    """
+    Escribe el 'Movimiento auxiliar por cuenta contable' como lo descarga el
+    sistema: bloque de encabezado, nombres de columna en la fila 8, filas de
+    cuenta y luego los movimientos. Excel con xlsxwriter o CSV según la extensión.
+    """
+    filas_encabezado = [
+        ["MOVIMIENTO AUXILIAR POR CUENTA CONTABLE"], [""], ["EMPRESA DE PRUEBA SAS"], ["NIT 900123456-1"],
+        ["Periodo: Del 01 de MARZO al 31 de MARZO de 2024"], [""], [""], ENCABEZADO_CONTABLE,
+        ["111005", "Bancos"], ["11100501", "4567-123456-78"],
+    ]
+    saldo = (movimientos["debito"] - movimientos["credito"]).cumsum()
+    datos = pd.DataFrame({
+        "codigo": "", "cuenta": "", "fecha": movimientos["fecha"].dt.strftime("%d/%m/%Y"),
+        "comprobante": movimientos["comprobante"], "tercero": movimientos["tercero"],
+        "debito": movimientos["debito"], "credito": movimientos["credito"], "saldo": saldo,
+    })
+
+    if ruta.endswith(".csv"):
+        with open(ruta, "w", encoding="utf-8", newline="") as f:
+            # Las filas vacías del encabezado van con sus comas, como en la exportación del sistema
+            for fila in filas_encabezado:
+                f.write(",".join(fila + [""] * (len(ENCABEZADO_CONTABLE) - len(fila))) + "\n")
+            datos.to_csv(f, header=False, index=False)
+        return
+
+    libro = xlsxwriter.Workbook(ruta, {"constant_memory": True})
+    hoja = libro.add_worksheet()
+    for i, fila in enumerate(filas_encabezado):
+        hoja.write_row(i, 0, fila)
+    for i, fila in enumerate(datos.itertuples(index=False), start=len(filas_encabezado)):
+        hoja.write_row(i, 0, fila)
+    libro.close()
+
+
+def escribir_extracto(movimientos, ruta, diseno="unico", semilla=0):
+    """
+    Escribe el extracto del mismo mes: ~90% de los movimientos contables con
+    1-2 días de diferencia, la mitad con la referencia del comprobante en la
+    descripción, más movimientos propios del banco (comisiones, GMF, intereses).
+    'diseno' es 'unico' (columna Valor con signo) o 'debito_credito'.
+    """
+    rng = np.random.default_rng(semilla + 1)
+    incluidas = movimientos[rng.random(len(movimientos)) < 0.9]
+    montos = (incluidas["debito"] - incluidas["credito"]).to_numpy()
+    con_referencia = rng.random(len(incluidas)) < 0.5
+    numeros = incluidas["comprobante"].str.split("-").str[1].to_numpy()
+    descripciones = np.where(
+        con_referencia,
+        "PAGO PSE REF " + pd.Series(numeros).to_numpy(),
+        np.where(montos > 0, "CONSIGNACION NACIONAL", "TRANSFERENCIA A TERCEROS")
+    )
+    propios = max(len(movimientos) // 50, 3)
+    conceptos = np.array(["IMPTO GOBIERNO 4X1000", "COBRO IVA SERVICIOS FINANCIEROS", "ABONO INTERESES AHORROS"])
+    extracto = pd.DataFrame({
+        "Fecha": pd.concat([
+            incluidas["fecha"] + pd.to_timedelta(rng.integers(0, 3, len(incluidas)), unit="D"),
+            pd.Series(pd.Timestamp("2024-03-31"), index=range(propios)),
+        ], ignore_index=True).dt.strftime("%Y-%m-%d"),
+        "Descripción": np.concatenate([descripciones, conceptos[np.arange(propios) % 3]]),
+        "Valor": np.concatenate([montos, np.where(np.arange(propios) % 3 == 2, 1234.56, -4000.0)]),
+    }).sample(frac=1.0, random_state=semilla)
+
+    if diseno == "debito_credito":
+        extracto["Cargos"] = (-extracto["Valor"]).clip(lower=0)
+        extracto["Abonos"] = extracto["Valor"].clip(lower=0)
+        extracto = extracto.drop(columns="Valor")
+
+    if ruta.endswith(".csv"):
+        extracto.to_csv(ruta, index=False)
+        return
+    libro = xlsxwriter.Workbook(ruta, {"constant_memory": True})
+    hoja = libro.add_worksheet()
+    hoja.write_row(0, 0, list(extracto.columns))
+    for i, fila in enumerate(extracto.itertuples(index=False), start=1):
+        hoja.write_row(i, 0, fila)
+    libro.close()
+
+
+def preparar_archivos(filas, diseno, formato, directorio, semilla=0):
+    """Rutas (auxiliar, extracto) del tamaño pedido; se generan solo si no existen."""
+    os.makedirs(directorio, exist_ok=True)
+    ruta_contab = os.path.join(directorio, f"auxiliar_{filas}_{semilla}.{formato}")
+    ruta_banco = os.path.join(directorio, f"extracto_{diseno}_{filas}_{semilla}.{formato}")
+    if not (os.path.exists(ruta_contab) and os.path.exists(ruta_banco)):
+        movimientos = generar_movimientos(filas, semilla)
+        escribir_auxiliar(movimientos, ruta_contab)
+        escribir_extracto(movimientos, ruta_banco, diseno, semilla)
+    return ruta_contab, ruta_banco
+
+
+# ==========================================================
+# ⏱️ MEDICIÓN POR ETAPAS
+# ==========================================================
+def medir_conciliacion(ruta_contab, ruta_banco, opciones=None, ruta_perfiles=None):
+    """
+    Ejecuta la conciliación etapa por etapa y devuelve (tiempos, conteos):
+    {etapa: segundos} y los registros, pares y pendientes obtenidos.
+    'fechas' mide solo la conversión de la columna de fecha del auxiliar, que
+    también queda incluida en 'normalizacion_contable' (y no se suma al total).
+    'carga_extracto' incluye la normalización del extracto, que se hace por
+    bloques al leerlo.
+    """
+    tiempos = {}
+
+    @contextlib.contextmanager
+    def etapa(nombre):
+        inicio = time.perf_counter()
+        yield
+        tiempos[nombre] = round(time.perf_counter() - inicio, 4)
+
+    def abrir(ruta):
+        with open(ruta, "rb") as f:
+            return archivo_en_memoria(os.path.basename(ruta), f.read())
+
+    archivo_contab, archivo_banco = abrir(ruta_contab), abrir(ruta_banco)
+
+    with etapa("carga_contable"):
+        df_contable_raw, metadatos = cargar_auxiliar_contable(archivo_contab)
+        df_contable_raw.columns = [limpiar_columna(str(c)) for c in df_contable_raw.columns]
+    with etapa("fechas"):
+        parsear_fechas(df_contable_raw["fecha"])
+    with etapa("normalizacion_contable"):
+        df_contable, _ = normalizar_contabilidad(df_contable_raw)
+    with etapa("carga_extracto"):
+        df_banco, _ = cargar_extracto(archivo_banco, ruta_perfiles=ruta_perfiles)
+    with etapa("emparejamiento"):
+        pares, agregados = emparejar_partidas(df_contable, df_banco, opciones)
+        if agregados is not None:
+            pares = pd.concat([pares, agregados], ignore_index=True)
+    with etapa("clasificacion"):
+        bloques = clasificar_partidas(df_contable, df_banco, pares)
+    with etapa("excel"):
+        saldo, _ = calcular_saldo_contable(df_contable_raw, df_contable)
+        generar_excel_conciliacion(bloques, saldo, metadatos)
+
+    tiempos["total"] = round(sum(tiempos.values()) - tiempos["fechas"], 4)
+    return tiempos, {
+        "registros_contables": len(df_contable),
+        "registros_banco": len(df_banco),
+        "partidas_conciliadas": len(pares),
+        "pendientes": sum(len(b) for b in bloques.values()),
+    }
+
+
+def _commit_actual():
+    """Hash corto del commit de git, o None si no se está en un repositorio."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _ultimo_resultado(ruta, clave):
+    """Último registro del JSONL con la misma combinación de tamaño, diseño y formato."""
+    if not os.path.exists(ruta):
+        return None
+    ultimo = None
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            registro = json.loads(linea)
+            if all(registro.get(k) == v for k, v in clave.items()):
+                ultimo = registro
+    return ultimo
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark por etapas de la conciliación bancaria")
+    parser.add_argument("--tamanos", default="1000,10000,100000",
+                        help="Filas del auxiliar separadas por coma (ej. 1000,10000,100000,1000000)")
+    parser.add_argument("--disenos", default=",".join(DISENOS_EXTRACTO),
+                        help="Diseños del extracto: unico, debito_credito")
+    parser.add_argument("--formato", choices=["xlsx", "csv"], default="xlsx")
+    parser.add_argument("--repeticiones", type=int, default=1, help="Corridas por combinación; se guarda la mejor")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--directorio", default=DIRECTORIO_BENCHMARK, help="Dónde se guardan los archivos generados")
+    parser.add_argument("--salida", default=RUTA_RESULTADOS, help="JSONL donde se agregan los resultados")
+    parser.add_argument("--opciones", default="{}", help="JSON con opciones de conciliación (ver OPCIONES_CONCILIACION)")
+    args = parser.parse_args()
+
+    opciones = {**OPCIONES_CONCILIACION, **json.loads(args.opciones)}
+    ruta_perfiles = os.path.join(args.directorio, "perfiles_extracto.json")
+    commit = _commit_actual()
+    directorio_salida = os.path.dirname(args.salida)
+    if directorio_salida:
+        os.makedirs(directorio_salida, exist_ok=True)
+
+    for filas in [int(t) for t in args.tamanos.split(",")]:
+        for diseno in args.disenos.split(","):
+            ruta_contab, ruta_banco = preparar_archivos(filas, diseno, args.formato, args.directorio, args.semilla)
+            corridas = [medir_conciliacion(ruta_contab, ruta_banco, opciones, ruta_perfiles) for _ in range(args.repeticiones)]
+            tiempos, conteos = min(corridas, key=lambda c: c[0]["total"])
+
+            clave = {"filas": filas, "diseno": diseno, "formato": args.formato}
+            anterior = _ultimo_resultado(args.salida, clave)
+            registro = {
+                "fecha": datetime.datetime.now().isoformat(timespec="seconds"), "commit": commit, **clave,
+                "python": platform.python_version(), "pandas": pd.__version__,
+                "opciones": opciones, "tiempos": tiempos, **conteos,
+            }
+            with open(args.salida, "a", encoding="utf-8") as f:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+            print(f"\n{filas:,} filas · extracto {diseno} · {args.formato} (commit {commit or '-'})")
+            for nombre, segundos in tiempos.items():
+                comparacion = ""
+                if anterior and nombre in anterior["tiempos"] and anterior["tiempos"][nombre] > 0:
+                    cambio = (segundos / anterior["tiempos"][nombre] - 1) * 100
+                    comparacion = f"  ({cambio:+.0f}% vs {anterior.get('commit') or anterior['fecha']})"
+                print(f"  {nombre:<24}{segundos:>10.3f} s{comparacion}")
+            print(f"  conciliadas {conteos['partidas_conciliadas']:,} · pendientes {conteos['pendientes']:,}")
+
+    print(f"\nResultados agregados a {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+from conciliacion_utils import (
+    MODO_EXACTO, MODO_TOLERANCIA, OPCIONES_CONCILIACION, conciliar, mensajes_conciliacion
+)
+
+# ==========================================================
+# 🖥️ CONCILIACIÓN BANCARIA DESDE LA LÍNEA DE COMANDOS
+# ==========================================================
+# Ejecuta la misma conciliación de la página de Streamlit sobre archivos en
+# disco y escribe el Excel resultante, para corridas programadas en el
+# servidor o para perfilar el proceso. Uso:
+#
+#   python conciliacion_cli.py auxiliar.xlsx extracto.xlsx
+#   python conciliacion_cli.py auxiliar.csv extracto.csv -o conciliacion.xlsx --arrastrar
+#   python conciliacion_cli.py auxiliar.xlsx extracto.xlsx --opciones '{"modo_emparejamiento": "Tolerancia y ventana de fechas", "tolerancia_monto": 1}'
+
+
+def leer_opciones(args):
+    """Opciones de conciliación: OPCIONES_CONCILIACION, el JSON de --opciones y los atajos."""
+    opciones = {**OPCIONES_CONCILIACION, **json.loads(args.opciones)}
+    desconocidas = set(opciones) - set(OPCIONES_CONCILIACION)
+    if desconocidas:
+        raise ValueError(f"Opciones desconocidas: {', '.join(sorted(desconocidas))}")
+    if opciones["modo_emparejamiento"] not in (MODO_EXACTO, MODO_TOLERANCIA):
+        raise ValueError(
+            f"modo_emparejamiento inválido: {opciones['modo_emparejamiento']!r} "
+            f"(use {MODO_EXACTO!r} o {MODO_TOLERANCIA!r})"
+        )
+    if args.arrastrar:
+        opciones["arrastrar_pendientes"] = True
+    if args.agregados:
+        opciones["buscar_agregados"] = True
+    if args.descripcion:
+        opciones["buscar_por_descripcion"] = True
+    return opciones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Conciliación bancaria sin interfaz")
+    parser.add_argument("contabilidad", help="Auxiliar contable (.xlsx o .csv) tal como sale del sistema")
+    parser.add_argument("extracto", help="Extracto bancario (.xlsx o .csv)")
+    parser.add_argument("-o", "--salida",
+                        help="Ruta del Excel generado (por defecto Conciliacion_Bancaria_<fecha>.xlsx)")
+    parser.add_argument("--opciones", default="{}", help="JSON con opciones de conciliación (ver OPCIONES_CONCILIACION)")
+    parser.add_argument("--arrastrar", action="store_true", help="Usa y actualiza los pendientes guardados de meses anteriores")
+    parser.add_argument("--agregados", action="store_true", help="Busca pagos agrupados")
+    parser.add_argument("--descripcion", action="store_true", help="Empareja pendientes por descripción")
+    parser.add_argument("--almacen", help="Ruta del almacén SQLite de pendientes (por defecto el del directorio de datos)")
+    args = parser.parse_args(argv)
+
+    try:
+        opciones = leer_opciones(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    with open(args.contabilidad, "rb") as archivo_contab, open(args.extracto, "rb") as archivo_banco:
+        resultado = conciliar(archivo_contab, archivo_banco, opciones, ruta_almacen=args.almacen)
+
+    for tipo, texto in mensajes_conciliacion(resultado):
+        print(texto, file=sys.stderr if tipo == "warning" else sys.stdout)
+
+    salida = args.salida or f"Conciliacion_Bancaria_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+    directorio = os.path.dirname(salida)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    with open(salida, "wb") as f:
+        f.write(resultado["excel"].getbuffer())
+    print(f"📄 Conciliación escrita en {salida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
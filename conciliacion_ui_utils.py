@@ -0,0 +1,181 @@
+import streamlit as st
+from conciliacion_utils import MODO_EXACTO, MODO_TOLERANCIA, consultar_partidas
+
+# ==========================================================
+# 🏦 COMPONENTES DE LA CONCILIACIÓN BANCARIA
+# ==========================================================
+# Separados de ui_utils para que las páginas de formularios tributarios no
+# carguen el motor de conciliación (ni xlsxwriter) al importar el CSS común.
+
+
+def opciones_conciliacion():
+    """
+    Expander con las opciones de emparejamiento de la conciliación bancaria.
+    Devuelve el dict de opciones que reciben las funciones de conciliacion_utils.
+    """
+    with st.expander("🎛️ Opciones de conciliación"):
+        cruzar_referencias = st.checkbox(
+            "Cruzar primero por número de referencia y monto",
+            value=True,
+            help="Empareja las partidas que comparten número de documento o transferencia y monto exacto "
+                 "antes de la conciliación por montos"
+        )
+        modo_emparejamiento = st.radio(
+            "Modo de emparejamiento",
+            [MODO_EXACTO, MODO_TOLERANCIA],
+            horizontal=True,
+            help="El modo con tolerancia empareja montos cercanos y prioriza las fechas más próximas"
+        )
+        priorizar_fechas = st.checkbox(
+            "Asignar por fecha más cercana dentro de montos iguales",
+            value=True,
+            disabled=modo_emparejamiento != MODO_EXACTO,
+            help="Cuando varias partidas tienen el mismo monto, empareja las de fechas más próximas"
+        )
+        col_tol, col_dias = st.columns(2)
+        with col_tol:
+            tolerancia_monto = st.number_input(
+                "Tolerancia de monto ($)", min_value=0.0, value=0.0, step=1.0,
+                disabled=modo_emparejamiento == MODO_EXACTO
+            )
+        with col_dias:
+            ventana_dias = st.number_input(
+                "Ventana de fechas (± días)", min_value=0, value=3, step=1,
+                disabled=modo_emparejamiento == MODO_EXACTO
+            )
+
+        buscar_por_descripcion = st.checkbox(
+            "Emparejar por descripción (misma operación con montos o textos distintos)",
+            value=False,
+            help="Pasada sobre los pendientes que cruza partidas que comparten NIT, número de factura "
+                 "o nombre del tercero, con montos cercanos y fechas próximas"
+        )
+        col_similitud, col_porcentaje, col_dias_desc = st.columns(3)
+        with col_similitud:
+            similitud_descripcion = st.number_input(
+                "Similitud mínima (0 a 1)", min_value=0.05, max_value=1.0, value=0.3, step=0.05,
+                disabled=not buscar_por_descripcion
+            )
+        with col_porcentaje:
+            porcentaje_monto_descripcion = st.number_input(
+                "Diferencia de monto (%)", min_value=0.0, max_value=100.0, value=2.0, step=0.5,
+                disabled=not buscar_por_descripcion
+            )
+        with col_dias_desc:
+            dias_descripcion = st.number_input(
+                "Ventana por descripción (± días)", min_value=0, value=5, step=1,
+                disabled=not buscar_por_descripcion
+            )
+
+        buscar_agregados = st.checkbox(
+            "Buscar pagos agrupados (varias partidas contra un solo movimiento)",
+            value=False,
+            help="Segunda pasada sobre los pendientes: lotes de proveedores, abonos de datáfono, etc."
+        )
+        col_partidas, col_dias_agr, col_tiempo = st.columns(3)
+        with col_partidas:
+            max_partidas_agregado = st.number_input(
+                "Máx. partidas por grupo", min_value=2, max_value=5, value=3, step=1,
+                disabled=not buscar_agregados
+            )
+        with col_dias_agr:
+            dias_agregado = st.number_input(
+                "Ventana del grupo (± días)", min_value=0, value=5, step=1,
+                disabled=not buscar_agregados
+            )
+        with col_tiempo:
+            limite_segundos_agregado = st.number_input(
+                "Tiempo máximo (segundos)", min_value=1, max_value=120, value=10, step=1,
+                disabled=not buscar_agregados
+            )
+
+        arrastrar_pendientes = st.checkbox(
+            "Arrastrar pendientes de meses anteriores",
+            value=False,
+            help="Usa las partidas sin conciliar guardadas en el almacén local para esta cuenta "
+                 "y guarda las pendientes de este mes"
+        )
+        dias_arrastre = st.number_input(
+            "Antigüedad máxima de un pendiente arrastrado (días)", min_value=0, value=180, step=30,
+            disabled=not arrastrar_pendientes,
+            help="Un pendiente de meses anteriores solo se concilia con movimientos nuevos de su mismo "
+                 "monto cuyas fechas disten a lo sumo estos días"
+        )
+
+    return {
+        "cruzar_referencias": cruzar_referencias,
+        "modo_emparejamiento": modo_emparejamiento,
+        "priorizar_fechas": priorizar_fechas,
+        "tolerancia_monto": float(tolerancia_monto),
+        "ventana_dias": int(ventana_dias),
+        "buscar_por_descripcion": buscar_por_descripcion,
+        "similitud_descripcion": float(similitud_descripcion),
+        "porcentaje_monto_descripcion": float(porcentaje_monto_descripcion),
+        "dias_descripcion": int(dias_descripcion),
+        "buscar_agregados": buscar_agregados,
+        "max_partidas_agregado": int(max_partidas_agregado),
+        "dias_agregado": int(dias_agregado),
+        "limite_segundos_agregado": float(limite_segundos_agregado),
+        "arrastrar_pendientes": arrastrar_pendientes,
+        "dias_arrastre": int(dias_arrastre),
+    }
+
+
+def vista_partidas_paginada(df, clave, columnas):
+    """
+    Vista previa de un bloque de partidas con búsqueda, filtros, orden y
+    paginación resueltos en el servidor (consultar_partidas): al navegador
+    solo se envía la página visible. 'clave' distingue los widgets de cada bloque.
+    """
+    if df.empty:
+        st.info("✅ No hay partidas en esta categoría")
+        return
+
+    con_fecha = "fecha" in columnas
+    col_texto, col_min, col_max = st.columns(3)
+    with col_texto:
+        texto = st.text_input("Buscar en la descripción", key=f"{clave}_texto")
+    with col_min:
+        monto_min = st.number_input("Monto desde ($, valor absoluto)", min_value=0.0, value=0.0, step=1000.0,
+                                    key=f"{clave}_monto_min")
+    with col_max:
+        monto_max = st.number_input("Monto hasta ($, 0 = sin límite)", min_value=0.0, value=0.0, step=1000.0,
+                                    key=f"{clave}_monto_max")
+
+    col_fechas, col_orden, col_desc, col_tamano = st.columns([2, 1, 1, 1])
+    fecha_desde = fecha_hasta = None
+    if con_fecha:
+        with col_fechas:
+            rango = st.date_input("Rango de fechas", value=(), key=f"{clave}_fechas")
+        if len(rango) == 2:
+            fecha_desde, fecha_hasta = rango
+        elif len(rango) == 1:
+            fecha_desde = rango[0]
+    with col_orden:
+        orden = st.selectbox("Ordenar por", columnas, key=f"{clave}_orden")
+    with col_desc:
+        descendente = st.checkbox("Descendente", key=f"{clave}_descendente")
+    with col_tamano:
+        tamano_pagina = st.selectbox("Filas por página", [50, 100, 500], index=1, key=f"{clave}_tamano")
+
+    # La página elegida está en la sesión antes de dibujar el widget; si los filtros
+    # reducen el número de páginas se ajusta al nuevo máximo
+    clave_pagina = f"{clave}_pagina"
+    resultado = consultar_partidas(
+        df, texto=texto.strip(), monto_min=monto_min or None, monto_max=monto_max or None,
+        fecha_desde=fecha_desde, fecha_hasta=fecha_hasta, orden=orden, descendente=descendente,
+        pagina=st.session_state.get(clave_pagina, 1), tamano_pagina=tamano_pagina
+    )
+    paginas = resultado["paginas"]
+    if st.session_state.get(clave_pagina, 1) > paginas:
+        st.session_state[clave_pagina] = paginas
+    pagina = st.number_input(f"Página (de {paginas})", min_value=1, max_value=paginas, step=1,
+                             key=clave_pagina)
+
+    inicio = (pagina - 1) * tamano_pagina
+    st.caption(
+        f"Mostrando {min(inicio + 1, resultado['filas'])}–{inicio + len(resultado['pagina'])} "
+        f"de {resultado['filas']} partidas (de {len(df)}) · Suma: ${resultado['suma']:,.2f}"
+    )
+    st.dataframe(resultado["pagina"][columnas], use_container_width=True)
+
@@ -0,0 +1,1951 @@
+import csv
+import datetime
+import functools
+import io
+import itertools
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from pandas.io.parsers import TextParser
+import xlsxwriter
+from openpyxl import load_workbook
+from texto_utils import normalizar_texto
+from almacen_utils import (
+    conectar, cargar_abiertas, periodo_posterior, registrar_periodo, periodo_de_fecha, cargar_perfiles, guardar_perfil
+)
+
+# ==========================================================
+# 📅 CONVERSIÓN DE FECHAS
+# ==========================================================
+FORMATOS_FECHA = [
+    "%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%m/%d/%Y", "%Y/%m/%d",
+    "%d.%m.%Y", "%d %m %Y", "%Y%m%d", "%d/%m/%y", "%d-%m-%y",
+    "%d/%m/%Y %H:%M:%S", "%Y-%m-%d %H:%M:%S"
+]
+
+ORIGEN_SERIAL_EXCEL = pd.Timestamp("1899-12-30")
+
+
+def _convertir_fecha_valor(val):
+    """Conversión celda a celda (solo para las celdas que el formato dominante no resuelve)."""
+    if pd.isna(val):
+        return None
+
+    if isinstance(val, (datetime.datetime, pd.Timestamp)):
+        return val
+
+    if isinstance(val, (int, float)):
+        if val > 1000:
+            try:
+                return datetime.datetime(1899, 12, 30) + datetime.timedelta(days=val)
+            except:
+                pass
+        if 1900 <= val <= 2100:
+            try:
+                return datetime.datetime(int(val), 1, 1)
+            except:
+                pass
+
+    if isinstance(val, str):
+        val = val.strip()
+        for fmt in FORMATOS_FECHA:
+            try:
+                return datetime.datetime.strptime(val, fmt)
+            except:
+                continue
+        try:
+            return pd.to_datetime(val, dayfirst=True, errors="coerce")
+        except:
+            pass
+    return None
+
+
+def describir_formato_fecha(fmt):
+    """Convierte un formato strptime a una descripción legible (p. ej. DD/MM/YYYY)."""
+    for codigo, texto in [("%d", "DD"), ("%m", "MM"), ("%Y", "YYYY"), ("%y", "YY"),
+                          ("%H", "HH"), ("%M", "MI"), ("%S", "SS")]:
+        fmt = fmt.replace(codigo, texto)
+    return fmt
+
+
+def inferir_formato_fecha(textos, tamano_muestra=200):
+    """
+    Prueba cada formato de FORMATOS_FECHA sobre una muestra de valores distintos
+    y devuelve el que convierte más celdas (en empate gana el primero de la lista).
+    """
+    muestra = pd.Series(textos.unique()[:tamano_muestra], dtype=object)
+    mejor, aciertos_mejor = None, 0
+    for fmt in FORMATOS_FECHA:
+        aciertos = pd.to_datetime(muestra, format=fmt, errors="coerce").notna().sum()
+        if aciertos > aciertos_mejor:
+            mejor, aciertos_mejor = fmt, aciertos
+    return mejor
+
+
+def _seriales_a_fechas(numeros):
+    """Convierte números seriales de Excel (> 1000) a fechas en bloque."""
+    numeros = pd.to_numeric(numeros, errors="coerce").astype("float64")
+    numeros = numeros.where((numeros > 1000) & (numeros < 150_000))
+    return pd.to_datetime(numeros, unit="D", origin=ORIGEN_SERIAL_EXCEL, errors="coerce")
+
+
+def parsear_fechas(col, formato=None):
+    """
+    Convierte una columna completa de fechas con operaciones vectorizadas.
+
+    Las fechas nativas y los seriales de Excel se convierten en bloque. Para los
+    textos se infiere el formato dominante sobre una muestra (o se usa 'formato'
+    si se indica) y se convierte toda la columna de una vez con ese formato;
+    solo las celdas que fallan pasan por la cadena de formatos celda a celda.
+    Devuelve (serie datetime64, descripción del formato detectado).
+    """
+    resultado = pd.Series(pd.NaT, index=col.index, dtype="datetime64[ns]")
+    if col.empty:
+        return resultado, "sin datos"
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return pd.to_datetime(col).astype("datetime64[ns]"), "fecha nativa"
+    if pd.api.types.is_numeric_dtype(col):
+        return _seriales_a_fechas(col).astype("datetime64[ns]"), "serial de Excel"
+
+    tipo = pd.api.types.infer_dtype(col, skipna=True)
+    if tipo == "string":
+        es_texto = col.notna()
+        es_fecha = es_numero = pd.Series(False, index=col.index)
+    else:
+        es_texto = col.map(lambda v: isinstance(v, str)).astype(bool)
+        es_fecha = col.map(lambda v: isinstance(v, datetime.datetime)).astype(bool)
+        es_numero = col.map(lambda v: isinstance(v, (int, float, np.number)) and not isinstance(v, bool)).astype(bool)
+
+    descripciones = []
+    if es_fecha.any():
+        resultado[es_fecha] = pd.to_datetime(col[es_fecha], errors="coerce")
+        descripciones.append("fecha nativa")
+    if es_numero.any():
+        resultado[es_numero] = _seriales_a_fechas(col[es_numero])
+        descripciones.append("serial de Excel")
+    if es_texto.any():
+        textos = col[es_texto].astype(str).str.strip()
+        textos = textos[textos != ""]
+        fmt = formato or inferir_formato_fecha(textos)
+        if fmt:
+            convertidas = pd.to_datetime(textos, format=fmt, errors="coerce")
+            resultado.loc[convertidas.index] = convertidas
+            descripciones.append(describir_formato_fecha(fmt))
+            fallidas = textos[convertidas.isna()]
+        else:
+            fallidas = textos
+        if not fallidas.empty:
+            unicas = pd.Series(fallidas.unique())
+            convertidas = pd.to_datetime(unicas.map(_convertir_fecha_valor), errors="coerce")
+            resultado.loc[fallidas.index] = fallidas.map(dict(zip(unicas, convertidas))).astype("datetime64[ns]")
+            descripciones.append(f"{len(fallidas)} celdas con formatos alternos")
+
+    return resultado, ", ".join(descripciones) or "sin fechas reconocibles"
+
+
+def convertir_fecha_unificada(col):
+    """Convierte una columna a fechas (ver parsear_fechas)."""
+    return parsear_fechas(col)[0]
+
+# ==========================================================
+# 💲 CONVERSIÓN DE MONTOS
+# ==========================================================
+# Separadores de miles puros: 1.234.567 o 1,234,567 (grupos exactos de tres)
+_PATRON_SOLO_MILES = r"\d{1,3}(?:\.\d{3})+|\d{1,3}(?:,\d{3})+"
+
+
+def _textos_a_montos(textos):
+    """Convierte montos en texto con formato local (ver parsear_montos) en bloque."""
+    textos = textos.astype(str).str.strip()
+    negativo = textos.str.fullmatch(r"\(.*\)") | textos.str.contains("-", regex=False)
+    limpio = textos.str.replace(r"[^\d,.]", "", regex=True)
+
+    # La coma es decimal si es el último separador y no forma grupos de miles
+    solo_miles = limpio.str.fullmatch(_PATRON_SOLO_MILES)
+    coma_decimal = limpio.str.contains(r",\d*$") & ~solo_miles
+
+    normalizado = limpio.str.replace(",", "", regex=False)
+    normalizado = normalizado.mask(
+        coma_decimal, limpio.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    )
+    normalizado = normalizado.mask(solo_miles, limpio.str.replace(r"[.,]", "", regex=True))
+
+    valores = pd.to_numeric(normalizado, errors="coerce").astype("float64")
+    return valores.where(~negativo.fillna(False).astype(bool), -valores)
+
+
+def parsear_montos(col):
+    """
+    Convierte una columna de montos a float64 con operaciones vectorizadas.
+
+    Los números se toman tal cual. Los textos admiten símbolo de moneda,
+    espacios, separador de miles con punto o coma, coma decimal y negativos con
+    signo o entre paréntesis: "$ 1.234.567,89", "(45.000,00)", "1,234.50".
+    Si hay punto y coma, el último es el decimal; un solo separador seguido de
+    grupos exactos de tres dígitos se toma como de miles ("45.000" = 45000).
+    Devuelve (serie float64, cantidad de celdas no vacías que no se pudieron convertir).
+    """
+    if pd.api.types.is_numeric_dtype(col):
+        return col.astype("float64"), 0
+
+    tipo = pd.api.types.infer_dtype(col, skipna=True)
+    if tipo in ("string", "empty"):
+        es_texto = col.notna()
+    elif tipo in ("integer", "floating", "mixed-integer-float", "decimal"):
+        es_texto = pd.Series(False, index=col.index)
+    else:
+        es_texto = col.map(lambda v: isinstance(v, str)).astype(bool)
+
+    if es_texto.all():
+        resultado = _textos_a_montos(col)
+    else:
+        resultado = pd.to_numeric(col.where(~es_texto), errors="coerce").astype("float64")
+    if es_texto.any() and not es_texto.all():
+        resultado[es_texto] = _textos_a_montos(col[es_texto])
+
+    vacias = col.isna() | (es_texto & (col.where(es_texto, "0").astype(str).str.strip() == ""))
+    no_convertidas = int((resultado.isna() & ~vacias.fillna(True)).sum())
+    return resultado, no_convertidas
+
+
+def montos_a_centavos(montos):
+    """Montos en pesos (sin NaN) a centavos enteros int64: los cruces por monto son exactos."""
+    return np.rint(np.asarray(montos, dtype="float64") * 100).astype("int64")
+
+
+# ==========================================================
+# 📂 CARGA DEL AUXILIAR CONTABLE
+# ==========================================================
+FILA_ENCABEZADO_CONTABLE = 7
+FILAS_METADATOS_CONTABLES = 10
+
+MESES = ["ENERO", "FEBRERO", "MARZO", "ABRIL", "MAYO", "JUNIO", "JULIO", "AGOSTO",
+         "SEPTIEMBRE", "OCTUBRE", "NOVIEMBRE", "DICIEMBRE"]
+
+
+def _texto_celda(filas, fila, columna, por_defecto="NO DISPONIBLE"):
+    """Valor de texto de una celda del encabezado, o 'por_defecto' si no existe o está vacía."""
+    try:
+        valor = filas[fila][columna]
+    except IndexError:
+        return por_defecto
+    if valor is None or (isinstance(valor, float) and pd.isna(valor)):
+        return por_defecto
+    texto = str(valor).strip()
+    return texto if texto else por_defecto
+
+
+def extraer_metadatos_contables(filas):
+    """
+    Extrae del bloque de encabezado del 'Movimiento auxiliar por cuenta contable'
+    (primeras filas, como listas de valores) los datos del reporte de conciliación.
+    """
+    texto_periodo = _texto_celda(filas, 4, 0, por_defecto="")
+    mes = "NO DISPONIBLE"
+    if texto_periodo:
+        mes = "MES NO DETECTADO"
+        for m in MESES:
+            if m in texto_periodo.upper():
+                mes = m
+
+    return {
+        "nombre_empresa": _texto_celda(filas, 2, 0, por_defecto="NOMBRE NO DISPONIBLE"),
+        "texto_periodo": texto_periodo,
+        "mes": mes,
+        "codigo_contable": _texto_celda(filas, 9, 0),
+        "id_cuenta_bancaria": _texto_celda(filas, 9, 1),
+    }
+
+
+def cargar_auxiliar_contable(archivo, fila_encabezado=FILA_ENCABEZADO_CONTABLE):
+    """
+    Lee el auxiliar contable una sola vez y devuelve (DataFrame, metadatos).
+
+    Para Excel abre el libro en modo de solo lectura y recorre las filas en
+    streaming: las primeras FILAS_METADATOS_CONTABLES alimentan los metadatos,
+    la fila 'fila_encabezado' da los nombres de columna y el resto son los
+    datos. Para CSV solo se decodifican las primeras líneas para los metadatos
+    y pd.read_csv lee los datos directamente del archivo, sin copiarlo entero
+    a memoria.
+    """
+    archivo.seek(0)
+    if archivo.name.lower().endswith(".csv"):
+        metadatos = extraer_metadatos_contables(_filas_iniciales(archivo, FILAS_METADATOS_CONTABLES))
+        df = pd.read_csv(archivo, header=fila_encabezado)
+        return df, metadatos
+
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        hoja = libro.worksheets[0]
+        hoja.reset_dimensions()
+        primeras, encabezado, datos = [], [], []
+        for i, fila in enumerate(hoja.iter_rows(values_only=True)):
+            if i < FILAS_METADATOS_CONTABLES:
+                primeras.append(list(fila))
+            if i == fila_encabezado:
+                encabezado = list(fila)
+            elif i > fila_encabezado:
+                datos.append(list(fila))
+    finally:
+        libro.close()
+
+    # Igual que pandas: sin columnas ni filas vacías al final
+    ancho = 0
+    for fila in [encabezado] + datos:
+        for j in range(len(fila) - 1, ancho - 1, -1):
+            if fila[j] is not None:
+                ancho = j + 1
+                break
+    while datos and all(v is None for v in datos[-1]):
+        datos.pop()
+    encabezado = (encabezado + [None] * ancho)[:ancho]
+    datos = [f[:ancho] + [None] * (ancho - len(f)) for f in datos]
+
+    # TextParser aplica la misma inferencia de tipos y nombres que pd.read_excel
+    df = TextParser([encabezado] + datos, header=0).read()
+    return df, extraer_metadatos_contables(primeras)
+
+
+# ==========================================================
+# 🧹 NORMALIZACIÓN DE ARCHIVOS
+# ==========================================================
+def limpiar_columna(col):
+    return normalizar_texto(col).replace("  ", " ")
+
+
+def buscar_columna(df, palabra):
+    cols = [c for c in df.columns if palabra in c]
+    if not cols:
+        return None
+    return cols[0]
+
+
+def encontrar_columna(df, lista_variantes):
+    for variante in lista_variantes:
+        candidatos = [c for c in df.columns if variante in c]
+        if candidatos:
+            return candidatos[0]
+    return None
+
+
+def cargar_archivo(uploaded_file, header=None):
+    """Carga archivo desde Streamlit uploader"""
+    if uploaded_file.name.endswith(".csv"):
+        return pd.read_csv(uploaded_file, header=header)
+    else:
+        return pd.read_excel(uploaded_file, header=header)
+
+
+DICC_COLUMNAS_BANCO = {
+    "fecha": ["fecha", "fecha operacion", "dia"],
+    "descripcion": ["descripcion", "descripcion del movimiento", "descripcion de la transaccion",
+                    "clase de movimiento", "concepto", "detalle", "narracion", "referencia"],
+    "monto_unico": ["valor", "monto", "valor original"],
+    "cargos": ["cargos", "debitos"],
+    "abonos": ["abonos", "creditos"]
+}
+
+
+def normalizar_contabilidad(df_contable_raw):
+    """
+    Convierte el auxiliar contable (columnas ya limpias) en el DataFrame
+    fecha/descripcion/centavos, cortado en la última fecha válida.
+    Devuelve (df_contable, info) con la columna y el formato de fecha detectados.
+    """
+    col_fecha = None
+    for c in df_contable_raw.columns:
+        if "fecha" in c.lower():
+            col_fecha = c
+            break
+
+    col_comp = buscar_columna(df_contable_raw, "comprobante") or df_contable_raw.columns[0]
+    col_tercero = buscar_columna(df_contable_raw, "tercero") or df_contable_raw.columns[1]
+    col_debito = buscar_columna(df_contable_raw, "debito") or df_contable_raw.columns[-2]
+    col_credito = buscar_columna(df_contable_raw, "credito") or df_contable_raw.columns[-1]
+
+    info = {"col_fecha": col_fecha, "formato_fecha": None, "ultima_fecha": None, "montos_no_convertidos": 0}
+    if col_fecha:
+        fechas, info["formato_fecha"] = parsear_fechas(df_contable_raw[col_fecha])
+    else:
+        fechas = pd.Series(pd.NaT, index=df_contable_raw.index, dtype="datetime64[ns]")
+
+    # Filtrar por última fecha válida
+    filtrado = df_contable_raw[fechas.notna()]
+    fechas = fechas[fechas.notna()]
+    if not filtrado.empty:
+        info["ultima_fecha"] = fechas.max()
+        indice_ultima_fecha = fechas.index[fechas == info["ultima_fecha"]].max()
+        filtrado = filtrado.loc[:indice_ultima_fecha]
+        fechas = fechas.loc[:indice_ultima_fecha]
+
+    df_contable = pd.DataFrame()
+    df_contable["fecha"] = fechas
+    df_contable["descripcion"] = (
+        filtrado[col_comp].astype(str).str.strip() + " " +
+        filtrado[col_tercero].astype(str).str.strip()
+    ).str.lower().astype("category")
+    debitos, no_debitos = parsear_montos(filtrado[col_debito])
+    creditos, no_creditos = parsear_montos(filtrado[col_credito])
+    df_contable["centavos"] = montos_a_centavos(debitos.fillna(0) - creditos.fillna(0))
+    info["montos_no_convertidos"] = no_debitos + no_creditos
+    return df_contable, info
+
+
+def normalizar_banco(df_banco_raw, formato_fecha=None):
+    """
+    Convierte el extracto bancario (columnas ya limpias) en el DataFrame
+    fecha/descripcion/centavos. Acepta una columna de valor con signo o el par
+    cargos/abonos. 'formato_fecha' fija el formato de las fechas en texto en
+    lugar de inferirlo. Devuelve (df_banco, info).
+    """
+    col_fecha_banco = encontrar_columna(df_banco_raw, DICC_COLUMNAS_BANCO["fecha"])
+    col_desc_banco = encontrar_columna(df_banco_raw, DICC_COLUMNAS_BANCO["descripcion"])
+    col_monto_unico = encontrar_columna(df_banco_raw, DICC_COLUMNAS_BANCO["monto_unico"])
+    col_cargos = encontrar_columna(df_banco_raw, DICC_COLUMNAS_BANCO["cargos"])
+    col_abonos = encontrar_columna(df_banco_raw, DICC_COLUMNAS_BANCO["abonos"])
+
+    if col_monto_unico:
+        montos, no_convertidos = parsear_montos(df_banco_raw[col_monto_unico])
+    elif col_cargos and col_abonos:
+        cargos, no_cargos = parsear_montos(df_banco_raw[col_cargos])
+        abonos, no_abonos = parsear_montos(df_banco_raw[col_abonos])
+        montos = abonos.fillna(0) - cargos.fillna(0)
+        no_convertidos = no_cargos + no_abonos
+    else:
+        raise ValueError("El extracto no tiene columna de valor ni columnas de cargos y abonos")
+
+    # Solo se normalizan las filas con monto: fecha y descripción se convierten sobre ellas
+    validos = montos.notna()
+    filas = df_banco_raw[validos]
+    df_banco = pd.DataFrame(index=filas.index)
+    df_banco["fecha"], descripcion_formato = parsear_fechas(filas[col_fecha_banco], formato_fecha)
+    df_banco["descripcion"] = (
+        filas[col_desc_banco].astype(str).str.strip().str.lower().str.replace(r"\s+", " ", regex=True)
+        .astype("category")
+    )
+    df_banco["centavos"] = montos_a_centavos(montos[validos])
+
+    info = {
+        "col_fecha": col_fecha_banco, "formato_fecha": descripcion_formato,
+        "registros": len(df_banco_raw), "montos_no_convertidos": no_convertidos
+    }
+    return df_banco, info
+
+
+def concatenar_partidas(partes):
+    """
+    Concatena DataFrames fecha/descripcion/centavos conservando la descripción
+    como categoría (pd.concat la convierte a objeto si las categorías difieren).
+    """
+    df = pd.concat([p[["fecha", "centavos"]] for p in partes])
+    descripciones = union_categoricals([p["descripcion"].astype("category") for p in partes])
+    df.insert(1, "descripcion", pd.Series(descripciones, index=df.index))
+    return df
+
+
+# Nombre canónico de cada columna del perfil dentro del DataFrame leído
+COLUMNAS_CANONICAS = {
+    "fecha": "fecha", "descripcion": "descripcion", "monto_unico": "valor",
+    "cargos": "cargos", "abonos": "abonos"
+}
+FILAS_BUSQUEDA_ENCABEZADO = 20
+
+
+def firma_encabezado(columnas):
+    """Firma de un encabezado: nombres de columna normalizados, en orden."""
+    return "|".join(limpiar_columna(str(c)) for c in columnas if c is not None and str(c).strip())
+
+
+def _filas_iniciales(archivo, cantidad=FILAS_BUSQUEDA_ENCABEZADO):
+    """Primeras filas del archivo como listas de valores, sin cargar el resto."""
+    archivo.seek(0)
+    if archivo.name.lower().endswith(".csv"):
+        lineas = [linea.decode("utf-8", errors="replace") for linea in itertools.islice(archivo, cantidad)]
+        filas = list(csv.reader(lineas))
+    else:
+        libro = load_workbook(archivo, read_only=True, data_only=True)
+        try:
+            hoja = libro.worksheets[0]
+            hoja.reset_dimensions()
+            filas = [list(f) for f in hoja.iter_rows(max_row=cantidad, values_only=True)]
+        finally:
+            libro.close()
+    archivo.seek(0)
+    return filas
+
+
+def _mapear_columnas(columnas):
+    """Resuelve fecha/descripción/montos sobre una lista de nombres originales."""
+    limpias = {}
+    for c in columnas:
+        if c is not None and str(c).strip():
+            limpias.setdefault(limpiar_columna(str(c)), c)
+    vacio = pd.DataFrame(columns=list(limpias))
+    mapeo = {}
+    for clave in COLUMNAS_CANONICAS:
+        encontrada = encontrar_columna(vacio, DICC_COLUMNAS_BANCO[clave])
+        mapeo[clave] = limpias[encontrada] if encontrada else None
+    if mapeo["monto_unico"]:
+        mapeo["cargos"] = mapeo["abonos"] = None
+    elif not (mapeo["cargos"] and mapeo["abonos"]):
+        mapeo["cargos"] = mapeo["abonos"] = None
+    return mapeo
+
+
+def _perfil_completo(mapeo):
+    return bool(mapeo["fecha"] and mapeo["descripcion"] and (mapeo["monto_unico"] or mapeo["cargos"]))
+
+
+def detectar_perfil_extracto(filas):
+    """
+    Busca en las primeras filas el encabezado del extracto (la primera fila con
+    fecha, descripción y monto reconocibles) y arma el perfil: fila del
+    encabezado, columna original de cada campo y tipos para la lectura.
+    Devuelve (firma, perfil) o (None, None) si no se reconoce el formato.
+    """
+    for i, fila in enumerate(filas):
+        mapeo = _mapear_columnas(fila)
+        if not _perfil_completo(mapeo):
+            continue
+        # Los montos que en la muestra son todos numéricos se leen como float64
+        tipos = {mapeo["descripcion"]: "string"}
+        for clave in ("monto_unico", "cargos", "abonos"):
+            if mapeo[clave] is None:
+                continue
+            j = fila.index(mapeo[clave])
+            valores = [f[j] for f in filas[i + 1:] if j < len(f) and f[j] not in (None, "")]
+            if valores and pd.to_numeric(pd.Series(valores, dtype=object), errors="coerce").notna().all():
+                tipos[mapeo[clave]] = "float64"
+        perfil = {"fila_encabezado": i, "columnas": mapeo, "tipos": tipos}
+        return firma_encabezado(fila), perfil
+    return None, None
+
+
+def obtener_perfil_extracto(archivo, ruta_perfiles=None):
+    """
+    Perfil del extracto según la firma de su encabezado: lo toma del registro
+    (almacen_utils) si ya se conoce o lo detecta. Devuelve (perfil, firma,
+    conocido) o (None, None, False) si no se reconoce el formato. Un perfil
+    detectado no se registra aquí: cargar_extracto lo guarda solo si con él se
+    leen fechas y montos.
+    """
+    filas = _filas_iniciales(archivo)
+    perfiles = cargar_perfiles(ruta_perfiles)
+    for i, fila in enumerate(filas):
+        firma = firma_encabezado(fila)
+        perfil = perfiles.get(firma)
+        if perfil and perfil["fila_encabezado"] == i:
+            return perfil, firma, True
+    firma, perfil = detectar_perfil_extracto(filas)
+    return perfil, firma, False
+
+
+def lectura_valida(df_banco):
+    """True si el extracto normalizado tiene fechas y montos: el perfil que lo leyó se puede registrar."""
+    return bool(df_banco["fecha"].notna().any() and df_banco["centavos"].notna().any())
+
+
+def _leer_extracto_csv_por_bloques(archivo, perfil, tamano_bloque):
+    """Normaliza un extracto CSV bloque a bloque (ver cargar_extracto)."""
+    usecols = [c for c in perfil["columnas"].values() if c]
+    renombrar = {c: COLUMNAS_CANONICAS[clave] for clave, c in perfil["columnas"].items() if c}
+
+    archivo.seek(0)
+    lector = pd.read_csv(
+        archivo, skiprows=perfil["fila_encabezado"], usecols=usecols,
+        dtype=perfil["tipos"], chunksize=tamano_bloque
+    )
+    partes, registros, no_convertidos, formato_fecha, descripciones_formato, info = [], 0, 0, None, [], None
+    for bloque in lector:
+        registros += len(bloque)
+        bloque = bloque.rename(columns=renombrar)
+        # El formato de fecha se infiere en el primer bloque con textos y se fija para el resto
+        if formato_fecha is None:
+            textos = bloque["fecha"].dropna()
+            textos = textos[textos.map(lambda v: isinstance(v, str))].astype(str).str.strip()
+            if not textos.empty:
+                formato_fecha = inferir_formato_fecha(textos)
+        parte, info = normalizar_banco(bloque, formato_fecha)
+        partes.append(parte)
+        no_convertidos += info["montos_no_convertidos"]
+        if info["formato_fecha"] not in descripciones_formato:
+            descripciones_formato.append(info["formato_fecha"])
+
+    if info is None:
+        vacio = pd.DataFrame(columns=list(renombrar.values()))
+        return normalizar_banco(vacio)
+    info["formato_fecha"] = ", ".join(descripciones_formato)
+    info["registros"] = registros
+    info["montos_no_convertidos"] = no_convertidos
+    return concatenar_partidas(partes), info
+
+
+def _leer_extracto_excel(archivo, perfil):
+    """Normaliza un extracto de Excel con las columnas y tipos del perfil (ver cargar_extracto)."""
+    renombrar = {c: COLUMNAS_CANONICAS[clave] for clave, c in perfil["columnas"].items() if c}
+    archivo.seek(0)
+    df_banco_raw = pd.read_excel(
+        archivo, header=perfil["fila_encabezado"], usecols=lambda c: c in renombrar, dtype=perfil["tipos"]
+    ).rename(columns=renombrar)
+    return normalizar_banco(df_banco_raw)
+
+
+def cargar_extracto(archivo, tamano_bloque=100_000, ruta_perfiles=None):
+    """
+    Carga y normaliza el extracto bancario. Devuelve (df_banco, info) como
+    normalizar_banco, con info['registros'] = filas leídas e info['perfil'].
+
+    El perfil del formato (fila del encabezado y columnas de fecha,
+    descripción y monto) se toma del registro de perfiles por la firma del
+    encabezado; si es nuevo se detecta y se registra solo después de leer con
+    él fechas y montos (lectura_valida), para que una detección equivocada no
+    se reutilice en los extractos siguientes. Con el perfil se leen solo las
+    columnas necesarias y con tipos explícitos; si algún monto no es numérico
+    más allá de la muestra se relee sin tipos fijos.
+
+    Los CSV se leen por bloques de 'tamano_bloque' filas; cada bloque se
+    normaliza y se descarta antes de leer el siguiente, así el pico de memoria
+    queda en el tamaño del DataFrame compacto fecha/descripcion/centavos y no en
+    varias copias del archivo.
+    """
+    perfil, firma, conocido = obtener_perfil_extracto(archivo, ruta_perfiles)
+    if perfil is None:
+        # Formato no reconocido: se lee completo y normalizar_banco informa qué falta
+        df_banco_raw = cargar_archivo(archivo, header=0)
+        df_banco_raw.columns = [limpiar_columna(str(c)) for c in df_banco_raw.columns]
+        df_banco, info = normalizar_banco(df_banco_raw)
+        info["perfil"] = "sin perfil"
+        return df_banco, info
+
+    if archivo.name.lower().endswith(".csv"):
+        try:
+            df_banco, info = _leer_extracto_csv_por_bloques(archivo, perfil, tamano_bloque)
+        except ValueError:
+            # Algún monto no numérico más allá de la muestra: se relee sin tipos fijos
+            perfil = {**perfil, "tipos": {}}
+            df_banco, info = _leer_extracto_csv_por_bloques(archivo, perfil, tamano_bloque)
+    else:
+        try:
+            df_banco, info = _leer_extracto_excel(archivo, perfil)
+        except ValueError:
+            perfil = {**perfil, "tipos": {}}
+            df_banco, info = _leer_extracto_excel(archivo, perfil)
+
+    if conocido:
+        info["perfil"] = "conocido"
+    elif lectura_valida(df_banco):
+        guardar_perfil(firma, perfil, ruta_perfiles)
+        info["perfil"] = "nuevo"
+    else:
+        info["perfil"] = "nuevo (no registrado: no se leyeron fechas y montos)"
+    return df_banco, info
+
+# ==========================================================
+# 🔍 MOTOR DE EMPAREJAMIENTO DE CONCILIACIÓN
+# ==========================================================
+# Cada etapa de emparejamiento recibe las partidas contables y bancarias
+# pendientes y devuelve un DataFrame de pares con las columnas
+# 'idx_contab' e 'idx_banco' (índices originales de cada lado).
+
+COLUMNAS_PARES = ["idx_contab", "idx_banco"]
+
+
+def pares_vacios():
+    """DataFrame de pares sin filas."""
+    return pd.DataFrame(columns=COLUMNAS_PARES)
+
+
+def _emparejar_por_claves(contab, banco, claves):
+    """Join de multiconjuntos sobre las columnas indicadas (ver emparejar_por_monto)."""
+    contab = contab.dropna(subset=claves)
+    banco = banco.dropna(subset=claves)
+    if contab.empty or banco.empty:
+        return pares_vacios()
+
+    izquierda = pd.DataFrame({c: contab[c].to_numpy() for c in claves})
+    izquierda["ocurrencia"] = contab.groupby(claves, sort=False).cumcount().to_numpy()
+    izquierda["idx_contab"] = contab.index
+
+    derecha = pd.DataFrame({c: banco[c].to_numpy() for c in claves})
+    derecha["ocurrencia"] = banco.groupby(claves, sort=False).cumcount().to_numpy()
+    derecha["idx_banco"] = banco.index
+
+    pares = izquierda.merge(derecha, on=claves + ["ocurrencia"], how="inner", sort=False)
+    return pares[COLUMNAS_PARES].reset_index(drop=True)
+
+
+def emparejar_por_monto(contab, banco, columna="centavos"):
+    """
+    Empareja uno a uno las partidas con el mismo monto como un join de multiconjuntos.
+
+    Cada aparición de un monto se numera en orden de llegada en ambos lados y se
+    cruza por (monto, ocurrencia): la k-ésima partida contable de un monto queda
+    con la k-ésima partida bancaria de ese mismo monto. Es el mismo resultado del
+    recorrido fila a fila que toma la primera partida bancaria disponible, pero
+    en tiempo lineal.
+    """
+    return _emparejar_por_claves(contab, banco, [columna])
+
+
+def _fechas_a_dias(serie):
+    """Convierte una columna de fechas a días enteros; las fechas inválidas quedan en -1."""
+    fechas = pd.to_datetime(serie, errors="coerce")
+    dias = fechas.to_numpy(dtype="datetime64[D]").astype("int64")
+    return np.where(fechas.isna().to_numpy(), -1, dias), fechas.notna().to_numpy()
+
+
+def _primeras_apariciones(valores, tamano):
+    """Máscara de la primera aparición de cada entero de 'valores' (0 <= v < tamano)."""
+    primera = np.empty(tamano, dtype=np.int64)
+    posiciones = np.arange(len(valores))
+    primera[valores[::-1]] = posiciones[::-1]
+    return primera[valores] == posiciones
+
+
+def _asignacion_voraz(candidatos, orden):
+    """
+    Asignación uno a uno voraz sobre pares candidatos ('pos_c', 'pos_b'),
+    donde las posiciones son enteros pequeños (posiciones dentro de cada lado).
+
+    Ordena los candidatos por las columnas de 'orden' (los empates conservan el
+    orden en que se generaron) y en cada ronda acepta los pares que son la mejor
+    opción tanto para su partida contable como para su partida bancaria. El
+    primer par del orden global siempre es mutuo, así que cada ronda avanza y el
+    resultado es el mismo del recorrido voraz clásico, pero cada ronda se
+    resuelve de forma vectorizada.
+    """
+    if candidatos.empty:
+        return pd.DataFrame(columns=["pos_c", "pos_b"])
+    pos_c = candidatos["pos_c"].to_numpy(dtype="int64")
+    pos_b = candidatos["pos_b"].to_numpy(dtype="int64")
+    if len(orden) == 1:
+        secuencia = np.argsort(candidatos[orden[0]].to_numpy(), kind="stable")
+    else:
+        secuencia = np.lexsort([candidatos[c].to_numpy() for c in reversed(orden)])
+    pos_c, pos_b = pos_c[secuencia], pos_b[secuencia]
+    tam_c, tam_b = int(pos_c.max()) + 1, int(pos_b.max()) + 1
+    usado_c = np.zeros(tam_c, dtype=bool)
+    usado_b = np.zeros(tam_b, dtype=bool)
+
+    elegidos_c, elegidos_b = [], []
+    while len(pos_c):
+        mutuos = _primeras_apariciones(pos_c, tam_c) & _primeras_apariciones(pos_b, tam_b)
+        elegidos_c.append(pos_c[mutuos])
+        elegidos_b.append(pos_b[mutuos])
+        usado_c[pos_c[mutuos]] = True
+        usado_b[pos_b[mutuos]] = True
+        libres = ~(usado_c[pos_c] | usado_b[pos_b])
+        pos_c, pos_b = pos_c[libres], pos_b[libres]
+
+    return pd.DataFrame({"pos_c": np.concatenate(elegidos_c), "pos_b": np.concatenate(elegidos_b)})
+
+
+def emparejar_con_tolerancia(contab, banco, tolerancia=0.0, dias=None, max_candidatos=25):
+    """
+    Empareja uno a uno partidas cuyo monto difiere a lo sumo en 'tolerancia'
+    y cuya fecha está dentro de ±'dias' (None ignora las fechas).
+
+    Primero cruza las partidas idénticas en (monto, fecha). Para el resto, el
+    extracto se ordena por (monto, fecha) y cada partida contable recorre los
+    montos distintos dentro de su tolerancia; en cada uno busca con búsqueda
+    binaria su propia fecha (y la ventana de ±'dias') y toma a lo sumo las
+    'max_candidatos' partidas más cercanas en fecha a cada lado. Los
+    candidatos se priorizan por diferencia de monto y luego de días, de modo
+    que el costo es O(n log n + n·g·max_candidatos), con g los montos
+    distintos del extracto dentro de la tolerancia.
+    """
+    if contab.empty or banco.empty:
+        return pares_vacios()
+
+    claves_exactas = ["centavos", "fecha"] if dias is not None else ["centavos"]
+    exactos = _emparejar_por_claves(contab, banco, claves_exactas)
+    contab, banco = separar_pendientes(contab, banco, exactos)
+    if contab.empty or banco.empty:
+        return exactos
+
+    dias_c, valida_c = _fechas_a_dias(contab["fecha"])
+    dias_b, valida_b = _fechas_a_dias(banco["fecha"])
+    montos_c = contab["centavos"].to_numpy(dtype="int64")
+    montos_b = banco["centavos"].to_numpy(dtype="int64")
+
+    # Extracto ordenado por (monto, fecha)
+    orden_b = np.lexsort((dias_b, montos_b))
+    montos_b, dias_b, valida_b = montos_b[orden_b], dias_b[orden_b], valida_b[orden_b]
+
+    # Grupos de monto igual del extracto y, por cada partida contable, los
+    # grupos cuyo monto está dentro de la tolerancia: un par (partida, grupo)
+    margen = int(round(float(tolerancia) * 100))
+    unicos = np.unique(montos_b)
+    desde_g = np.searchsorted(unicos, montos_c - margen, side="left")
+    hasta_g = np.searchsorted(unicos, montos_c + margen, side="right")
+    grupos_por_c = np.clip(hasta_g - desde_g, 0, None)
+    c_de_par = np.repeat(np.arange(len(contab)), grupos_por_c)
+    g_de_par = np.repeat(desde_g, grupos_por_c) + (
+        np.arange(int(grupos_por_c.sum())) - np.repeat(np.cumsum(grupos_por_c) - grupos_por_c, grupos_por_c)
+    )
+
+    # Llave (grupo, día) ordenada como el extracto: la fecha de la partida
+    # contable se ubica por búsqueda binaria dentro de cada grupo
+    base = dias_b.min()
+    rango_dias = int(dias_b.max() - base) + 2
+    llave_b = np.searchsorted(unicos, montos_b) * rango_dias + (dias_b - base)
+
+    def posicion(dias_rel, lado):
+        return np.searchsorted(llave_b, g_de_par * rango_dias + np.clip(dias_rel, 0, rango_dias - 1), side=lado)
+
+    dias_rel_c = dias_c[c_de_par] - base
+    centro = posicion(dias_rel_c, "left")
+    if dias is not None:
+        inicio = posicion(dias_rel_c - dias, "left")
+        fin = posicion(dias_rel_c + dias, "right")
+    else:
+        inicio = np.searchsorted(montos_b, unicos[g_de_par], side="left")
+        fin = np.searchsorted(montos_b, unicos[g_de_par], side="right")
+    inicio = np.maximum(inicio, centro - max_candidatos)
+    fin = np.minimum(fin, centro + max_candidatos)
+
+    largos = np.clip(fin - inicio, 0, None)
+    total = int(largos.sum())
+    if total == 0:
+        return exactos
+
+    pos_c = np.repeat(c_de_par, largos)
+    desplazamientos = np.arange(total) - np.repeat(np.cumsum(largos) - largos, largos)
+    pos_b = np.repeat(inicio, largos) + desplazamientos
+
+    candidatos = pd.DataFrame({
+        "pos_c": pos_c,
+        "pos_b": pos_b,
+        "dif_monto": np.abs(montos_c[pos_c] - montos_b[pos_b]),
+        "dif_dias": np.abs(dias_c[pos_c] - dias_b[pos_b]),
+    })
+    if dias is not None:
+        validos = valida_c[pos_c] & valida_b[pos_b] & (candidatos["dif_dias"].to_numpy() <= dias)
+        candidatos = candidatos[validos]
+
+    elegidos = _asignacion_voraz(candidatos, ["dif_monto", "dif_dias"])
+    if elegidos.empty:
+        return exactos
+
+    aproximados = pd.DataFrame({
+        "idx_contab": contab.index[elegidos["pos_c"].to_numpy(dtype="int64")],
+        "idx_banco": banco.index[orden_b[elegidos["pos_b"].to_numpy(dtype="int64")]],
+    })
+    return pd.concat([exactos, aproximados], ignore_index=True)
+
+
+def emparejar_por_monto_y_fecha(contab, banco, limite_grupo=10_000):
+    """
+    Empareja montos iguales uno a uno priorizando las fechas más cercanas.
+
+    Empareja la misma cantidad de partidas que emparejar_por_monto, pero dentro
+    de cada grupo de monto igual elige los pares de fechas más próximas:
+    - partidas idénticas en (monto, fecha) se cruzan directamente;
+    - grupos del mismo tamaño en ambos lados se emparejan por orden de fecha,
+      que en una dimensión es la asignación de distancia total mínima;
+    - los grupos de distinto tamaño con n·m <= 'limite_grupo' se asignan de
+      forma voraz por menor diferencia de días (_asignacion_voraz).
+    Todo se resuelve con joins sobre todos los grupos a la vez. Lo que queda
+    (grupos muy grandes o partidas sin fecha) se empareja por orden de llegada.
+    """
+    if contab.empty or banco.empty:
+        return pares_vacios()
+    exactos = _emparejar_por_claves(contab, banco, ["centavos", "fecha"])
+    contab_rest, banco_rest = separar_pendientes(contab, banco, exactos)
+
+    dias_c, valida_c = _fechas_a_dias(contab_rest["fecha"])
+    dias_b, valida_b = _fechas_a_dias(banco_rest["fecha"])
+    izquierda = pd.DataFrame({
+        "centavos": contab_rest["centavos"].to_numpy()[valida_c],
+        "dias": dias_c[valida_c],
+        "idx_contab": contab_rest.index[valida_c],
+    })
+    derecha = pd.DataFrame({
+        "centavos": banco_rest["centavos"].to_numpy()[valida_b],
+        "dias": dias_b[valida_b],
+        "idx_banco": banco_rest.index[valida_b],
+    })
+
+    tamanos = pd.concat(
+        [izquierda.groupby("centavos").size().rename("n_c"), derecha.groupby("centavos").size().rename("n_b")],
+        axis=1, join="inner"
+    )
+
+    # Grupos del mismo tamaño: k-ésima fecha con k-ésima fecha
+    iguales = tamanos.index[tamanos["n_c"] == tamanos["n_b"]]
+    izq = izquierda[izquierda["centavos"].isin(iguales)].sort_values(["centavos", "dias"], kind="mergesort")
+    der = derecha[derecha["centavos"].isin(iguales)].sort_values(["centavos", "dias"], kind="mergesort")
+    izq = izq.assign(rango=izq.groupby("centavos").cumcount())
+    der = der.assign(rango=der.groupby("centavos").cumcount())
+    por_rango = izq.merge(der, on=["centavos", "rango"])[COLUMNAS_PARES]
+
+    # Grupos de distinto tamaño: voraz por menor diferencia de días
+    desiguales = tamanos.index[
+        (tamanos["n_c"] != tamanos["n_b"]) & (tamanos["n_c"] * tamanos["n_b"] <= limite_grupo)
+    ]
+    izq = izquierda[izquierda["centavos"].isin(desiguales)].reset_index(drop=True)
+    der = derecha[derecha["centavos"].isin(desiguales)].reset_index(drop=True)
+    candidatos = (
+        izq.rename_axis("pos_c").reset_index()
+        .merge(der.rename_axis("pos_b").reset_index(), on="centavos", suffixes=("_c", "_b"))
+    )
+    candidatos["dif_dias"] = (candidatos["dias_c"] - candidatos["dias_b"]).abs()
+    elegidos = _asignacion_voraz(candidatos[["pos_c", "pos_b", "dif_dias"]], ["dif_dias"])
+    por_cercania = pd.DataFrame({
+        "idx_contab": izq["idx_contab"].to_numpy()[elegidos["pos_c"].to_numpy(dtype="int64")],
+        "idx_banco": der["idx_banco"].to_numpy()[elegidos["pos_b"].to_numpy(dtype="int64")],
+    })
+
+    pares = pd.concat([exactos, por_rango, por_cercania], ignore_index=True)
+
+    # Remanente (grupos grandes o partidas sin fecha) por orden de llegada
+    contab_rest, banco_rest = separar_pendientes(contab, banco, pares)
+    restantes = emparejar_por_monto(contab_rest, banco_rest)
+    return pd.concat([pares, restantes], ignore_index=True)
+
+
+def _buscar_subconjunto(valores, objetivo, max_partidas, fin):
+    """
+    Busca el subconjunto más pequeño (2..max_partidas) de 'valores' (centavos)
+    que suma exactamente 'objetivo'. Enumera combinaciones de tamaño k-1 y busca
+    el faltante en un índice hash de valores, así que nunca enumera el tamaño k
+    completo. Devuelve las posiciones o None si no hay o se acabó el tiempo.
+    """
+    indice = {}
+    for pos, valor in enumerate(valores):
+        indice.setdefault(valor, []).append(pos)
+    for tamano in range(2, max_partidas + 1):
+        for combo in itertools.combinations(range(len(valores)), tamano - 1):
+            if time.perf_counter() > fin:
+                return None
+            faltante = objetivo - sum(valores[p] for p in combo)
+            for pos in indice.get(faltante, ()):
+                if pos > combo[-1]:
+                    return combo + (pos,)
+    return None
+
+
+def _agregar_un_sentido(objetivos, piezas, max_partidas, dias, max_candidatos, fin):
+    """
+    Cruza cada partida de 'objetivos' contra varias partidas de 'piezas' del mismo
+    signo, dentro de ±'dias', cuya suma es exactamente su monto.
+    Devuelve una lista de (idx_objetivo, [idx_piezas]) y si se agotó el tiempo.
+    """
+    centavos_o = objetivos["centavos"].to_numpy(dtype="int64")
+    centavos_p = piezas["centavos"].to_numpy(dtype="int64")
+    dias_o, valida_o = _fechas_a_dias(objetivos["fecha"])
+    dias_p, valida_p = _fechas_a_dias(piezas["fecha"])
+
+    orden_p = np.argsort(dias_p, kind="stable")
+    orden_p = orden_p[valida_p[orden_p]]
+    dias_ordenados = dias_p[orden_p]
+    usada = np.zeros(len(piezas), dtype=bool)
+
+    resultados = []
+    for pos_o in np.argsort(dias_o, kind="stable"):
+        if not valida_o[pos_o] or centavos_o[pos_o] == 0:
+            continue
+        if time.perf_counter() > fin:
+            return resultados, True
+
+        objetivo = centavos_o[pos_o]
+        desde = np.searchsorted(dias_ordenados, dias_o[pos_o] - dias, side="left")
+        hasta = np.searchsorted(dias_ordenados, dias_o[pos_o] + dias, side="right")
+        ventana = orden_p[desde:hasta]
+        ventana = ventana[
+            ~usada[ventana]
+            & (np.sign(centavos_p[ventana]) == np.sign(objetivo))
+            & (np.abs(centavos_p[ventana]) < abs(objetivo))
+        ]
+        if len(ventana) < 2:
+            continue
+        if len(ventana) > max_candidatos:
+            cercania = np.argsort(np.abs(dias_p[ventana] - dias_o[pos_o]), kind="stable")
+            ventana = ventana[cercania[:max_candidatos]]
+
+        combo = _buscar_subconjunto(centavos_p[ventana].tolist(), int(objetivo), max_partidas, fin)
+        if combo is None:
+            continue
+        elegidas = ventana[list(combo)]
+        usada[elegidas] = True
+        resultados.append((objetivos.index[pos_o], list(piezas.index[elegidas])))
+
+    return resultados, time.perf_counter() > fin
+
+
+def emparejar_agregados(contab, banco, max_partidas=3, dias=5, limite_segundos=10.0, max_candidatos=40):
+    """
+    Segunda pasada opcional sobre las partidas pendientes: busca movimientos
+    bancarios que liquidan varias partidas contables (pagos en lote, abonos de
+    datáfono) y partidas contables que agrupan varios movimientos del extracto.
+
+    Cada grupo suma exactamente el monto de la partida única, tiene entre 2 y
+    'max_partidas' partidas del mismo signo y cae dentro de ±'dias'. La búsqueda
+    se limita a las 'max_candidatos' partidas más cercanas en fecha y a
+    'limite_segundos' en total; si el tiempo se agota, pares.attrs["tiempo_agotado"]
+    queda en True y se devuelve lo encontrado hasta ese momento.
+    """
+    fin = time.perf_counter() + limite_segundos
+    filas = []
+
+    # Un movimiento bancario contra varias partidas contables
+    grupos, agotado = _agregar_un_sentido(banco, contab, max_partidas, dias, max_candidatos, fin)
+    for idx_banco, indices_contab in grupos:
+        filas.extend((idx_contab, idx_banco) for idx_contab in indices_contab)
+
+    # Una partida contable contra varios movimientos bancarios
+    if not agotado:
+        usados_contab = {idx for idx, _ in filas}
+        usados_banco = {idx for _, idx in filas}
+        grupos, agotado = _agregar_un_sentido(
+            contab[~contab.index.isin(usados_contab)], banco[~banco.index.isin(usados_banco)],
+            max_partidas, dias, max_candidatos, fin
+        )
+        for idx_contab, indices_banco in grupos:
+            filas.extend((idx_contab, idx_banco) for idx_banco in indices_banco)
+
+    pares = pd.DataFrame(filas, columns=COLUMNAS_PARES) if filas else pares_vacios()
+    pares.attrs["tiempo_agotado"] = agotado
+    return pares
+
+
+# Número de documento o transferencia: el que sigue a una palabra de referencia
+# (ref, factura, ce-, cheque...) o un número suelto de 4 o más dígitos
+PATRON_REFERENCIA = re.compile(
+    r"\b(?:ref|referencia|doc|documento|comprobante|factura|fact|fv|fc|ce|rc|cheque|chq|ch|tr|transf|nro|no)"
+    r"\W*(\d{3,})\b|\b(\d{4,})\b"
+)
+
+
+def extraer_referencias(descripciones):
+    """
+    Referencias de cada descripción como DataFrame (pos, referencia), sin ceros
+    a la izquierda. La extracción es vectorizada (str.extractall) y se hace una
+    vez por descripción distinta; luego se expande a las filas por el código de
+    categoría.
+    """
+    categorias = descripciones.astype("category")
+    textos = pd.Series(categorias.cat.categories.astype(str))
+    encontradas = textos.str.extractall(PATRON_REFERENCIA)
+    por_categoria = pd.DataFrame({
+        "codigo": encontradas.index.get_level_values(0).to_numpy(dtype="int64"),
+        "referencia": encontradas[0].fillna(encontradas[1]).str.lstrip("0").to_numpy(),
+    })
+    por_categoria = por_categoria[por_categoria["referencia"] != ""]
+    filas = pd.DataFrame({"pos": np.arange(len(categorias)), "codigo": categorias.cat.codes.to_numpy(dtype="int64")})
+    return filas.merge(por_categoria, on="codigo")[["pos", "referencia"]].drop_duplicates()
+
+
+def emparejar_por_referencia(contab, banco):
+    """
+    Primera pasada: cruza las partidas que comparten número de referencia y
+    monto exacto con un join hash sobre (referencia, centavos). Solo se aceptan
+    los pares sin ambigüedad, donde cada partida coincide con una única partida
+    del otro lado; el resto queda para los emparejadores por monto.
+    """
+    if contab.empty or banco.empty:
+        return pares_vacios()
+    referencias_c = extraer_referencias(contab["descripcion"])
+    referencias_b = extraer_referencias(banco["descripcion"])
+    referencias_c["centavos"] = contab["centavos"].to_numpy(dtype="int64")[referencias_c["pos"].to_numpy()]
+    referencias_b["centavos"] = banco["centavos"].to_numpy(dtype="int64")[referencias_b["pos"].to_numpy()]
+
+    cruces = referencias_c.merge(referencias_b, on=["referencia", "centavos"], suffixes=("_c", "_b"))
+    cruces = cruces[["pos_c", "pos_b"]].drop_duplicates()
+    unicos = ~cruces["pos_c"].duplicated(keep=False) & ~cruces["pos_b"].duplicated(keep=False)
+    cruces = cruces[unicos]
+    return pd.DataFrame({
+        "idx_contab": contab.index[cruces["pos_c"].to_numpy(dtype="int64")],
+        "idx_banco": banco.index[cruces["pos_b"].to_numpy(dtype="int64")],
+    })
+
+
+def _tokens_por_fila(descripciones, vocabulario):
+    """
+    Pares (pos, token) de las palabras de cada descripción, con los tokens como
+    enteros de 'vocabulario'. Cada descripción distinta se tokeniza una sola vez
+    y se expande a las filas con un join por su código de categoría. Se omiten
+    las palabras de una letra y los números pierden los ceros a la izquierda
+    (factura 00123 = 123).
+    """
+    categorias = descripciones.astype("category")
+    codigos_filas = categorias.cat.codes.to_numpy(dtype="int64")
+    textos = categorias.cat.categories
+    codigos, tokens = [], []
+    # Solo las categorías presentes: las no usadas (heredadas de la columna
+    # completa) dejarían palabras sin frecuencia en el vocabulario
+    for codigo in np.unique(codigos_filas[codigos_filas >= 0]).tolist():
+        for palabra in set(tokens_concepto(textos[codigo])):
+            if palabra.isdigit():
+                palabra = palabra.lstrip("0") or "0"
+            elif len(palabra) < 2:
+                continue
+            codigos.append(codigo)
+            tokens.append(vocabulario.setdefault(palabra, len(vocabulario)))
+    por_categoria = pd.DataFrame({"codigo": np.array(codigos, dtype="int64"), "token": np.array(tokens, dtype="int64")})
+    filas = pd.DataFrame({"pos": np.arange(len(categorias)), "codigo": codigos_filas})
+    return filas.merge(por_categoria, on="codigo")[["pos", "token"]]
+
+
+def emparejar_por_descripcion(contab, banco, similitud_minima=0.3, porcentaje_monto=2.0, dias=5, max_frecuencia=200):
+    """
+    Pasada opcional sobre las partidas pendientes: empareja uno a uno la misma
+    operación registrada con descripciones distintas en cada lado (comprobante
+    y tercero en contabilidad, texto libre en el extracto) a partir de las
+    palabras que comparten: NIT, números de factura, nombres de terceros.
+
+    Las palabras se indexan en un índice invertido (palabra -> partidas) y cada
+    partida contable solo se compara con las del extracto que comparten alguna
+    palabra; las palabras presentes en más de 'max_frecuencia' partidas de un
+    lado no generan candidatos, así que el costo no es cuadrático.
+    Cada candidato se califica con la similitud coseno de los pesos IDF de sus
+    palabras y debe tener el mismo signo, un monto a lo sumo 'porcentaje_monto'
+    % distinto y una fecha dentro de ±'dias'. La asignación prioriza la mayor
+    similitud y luego la menor diferencia de monto y de días.
+    """
+    if contab.empty or banco.empty:
+        return pares_vacios()
+
+    vocabulario = {}
+    tokens_c = _tokens_por_fila(contab["descripcion"], vocabulario)
+    tokens_b = _tokens_por_fila(banco["descripcion"], vocabulario)
+    if tokens_c.empty or tokens_b.empty:
+        return pares_vacios()
+
+    # Peso IDF de cada palabra sobre las partidas de ambos lados
+    frecuencia = np.bincount(
+        np.concatenate([tokens_c["token"].to_numpy(), tokens_b["token"].to_numpy()]), minlength=len(vocabulario)
+    )
+    peso = np.log((len(contab) + len(banco)) / frecuencia) + 1.0
+    norma_c = np.sqrt(np.bincount(tokens_c["pos"], weights=peso[tokens_c["token"]] ** 2, minlength=len(contab)))
+    norma_b = np.sqrt(np.bincount(tokens_b["pos"], weights=peso[tokens_b["token"]] ** 2, minlength=len(banco)))
+
+    # Índice invertido sin las palabras demasiado frecuentes en alguno de los lados
+    en_contab = np.bincount(tokens_c["token"], minlength=len(vocabulario))
+    en_extracto = np.bincount(tokens_b["token"], minlength=len(vocabulario))
+    indexable = (en_contab <= max_frecuencia) & (en_extracto <= max_frecuencia)
+    candidatos = tokens_c[indexable[tokens_c["token"].to_numpy()]].merge(
+        tokens_b[indexable[tokens_b["token"].to_numpy()]], on="token", suffixes=("_c", "_b")
+    )
+    if candidatos.empty:
+        return pares_vacios()
+    candidatos["peso"] = peso[candidatos["token"].to_numpy()] ** 2
+    candidatos = candidatos.groupby(["pos_c", "pos_b"], as_index=False, sort=False)["peso"].sum()
+
+    pos_c = candidatos["pos_c"].to_numpy()
+    pos_b = candidatos["pos_b"].to_numpy()
+    similitud = candidatos["peso"].to_numpy() / (norma_c[pos_c] * norma_b[pos_b])
+    montos_c = contab["centavos"].to_numpy(dtype="int64")[pos_c]
+    montos_b = banco["centavos"].to_numpy(dtype="int64")[pos_b]
+    dif_monto = np.abs(montos_c - montos_b)
+    dias_c, valida_c = _fechas_a_dias(contab["fecha"])
+    dias_b, valida_b = _fechas_a_dias(banco["fecha"])
+    dif_dias = np.abs(dias_c[pos_c] - dias_b[pos_b])
+
+    validos = (
+        (similitud >= similitud_minima)
+        & (np.sign(montos_c) == np.sign(montos_b))
+        & (dif_monto * 100 <= porcentaje_monto * np.maximum(np.abs(montos_c), np.abs(montos_b)))
+        & valida_c[pos_c] & valida_b[pos_b] & (dif_dias <= dias)
+    )
+    candidatos = pd.DataFrame({
+        "pos_c": pos_c[validos], "pos_b": pos_b[validos], "orden_similitud": -similitud[validos],
+        "dif_monto": dif_monto[validos], "dif_dias": dif_dias[validos],
+    })
+    elegidos = _asignacion_voraz(candidatos, ["orden_similitud", "dif_monto", "dif_dias"])
+    if elegidos.empty:
+        return pares_vacios()
+    return pd.DataFrame({
+        "idx_contab": contab.index[elegidos["pos_c"].to_numpy(dtype="int64")],
+        "idx_banco": banco.index[elegidos["pos_b"].to_numpy(dtype="int64")],
+    })
+
+
+def separar_pendientes(contab, banco, pares):
+    """Devuelve las partidas contables y bancarias que no quedaron en ningún par."""
+    contab_no_banco = contab[~contab.index.isin(pares["idx_contab"])]
+    banco_no_contab = banco[~banco.index.isin(pares["idx_banco"])]
+    return contab_no_banco, banco_no_contab
+
+
+# ==========================================================
+# 💰 INGRESOS/GASTOS BANCARIOS
+# ==========================================================
+DICC_BANCARIO = [
+    "ABONO INTERESES AHORROS","ABONO INTERESES GANADOS","ABONO X GRAVAMEN MOVIMIENTO FINANCIERO",
+    "GRAVAMEN MOVIMIENTO FINANCIERO","GRAVAMEN A LOS MOVIMIENTOS FINANCIEROS","AJUSTE INTERES AHORROS DB",
+    "CARGO IVA","COBRO CUOT MANEJO TARJ DEBITO","COBRO DE COMISION POR EL USO DEL PORTAL BUSINESS",
+    "COBRO PAGO PROVEEDORES OLROS BANCOS","COBRO PAGO PROVEEDORES OTROS BANCOS","COBRO SERVICIO EMPRESARIAL",
+    "COBRO SERVICIO MANEJO PORTAL","COBRO TRANSF. ENVIADA OTRA ENTIDAD","COM.IVA MES B.VIR","COM.MES B.VIRTUAL",
+    "COMIS RETIRO CAJERO NO BANCOL","COMISION CHEQUE DEVUELTO","COMISION POR USO CAJERO OTRA ENTIDAD",
+    "COMISION TRANSF. ENVIADA OTRA ENTIDAD","COMISION TRANSF. ENVIADA OTRA ENTIDAD B","COMISIONES",
+    "COSTO CHEQUERA","COSTO CHEQUERA X 25 CHEQUES","COSTO CHEQUERA X 50 CHEQUES","CUOTA MANEJO TARJETA DEBITO",
+    "DEVOLUCION COMISION","GMF - RETIRO SUCURSAL","IMP. GMF","IVA COMISION TRANSF. ENVIADA",
+    "IVA COMISION TRANSF. ENVIADA OTRA ENTIDAD","IVA COMISION TRANSF. ENVIADA OTRA ENTIDAD B",
+    "IVA COMISIONES","IVA POR SERVICIOS","IVA COSTO CHEQUERA","IVA GMF - RETIRO SUCURSAL",
+    "IVA TRANSFERENCIA ENVIADA","IVA TRANSFERENCIA ENVIADA OTRA ENTIDAD",
+    "COMISION PAGO PROVEEDORES OTROS BANCOS","RENDIMIENTOS FINANCIEROS",
+    "REINTEGRO GRAVAMEN MVTO FINANCIERO", "COBRO CONSULTA SALDOS Y MOVIMIENTOS",
+    "DESCUENTO SOLICITUD COPIA EXTRACTO", "IMPTO GOBIERNO 4X1000", "CUOTA MANEJO TRJ DEB",
+    "CXC IMPTO GOBIERNO 4X1000 MON", "AJUSTE X GRAVAMEN MOVIMIENTO FINANCIER",
+    "COBRO IVA SERVICIOS FINANCIEROS", "COBRO CUOTA DE MANEJO TARJETA DEBITO",
+    "RENDIMIENTOS FINANCIEROS.",
+]
+
+_FIN_CONCEPTO = ""
+
+
+def tokens_concepto(texto):
+    """Palabras de un concepto o descripción: normalizar_texto sin puntuación."""
+    return re.findall(r"[a-z0-9]+", normalizar_texto(texto))
+
+
+@functools.lru_cache(maxsize=8)
+def compilar_clasificador(conceptos):
+    """
+    Compila una tupla de conceptos en un trie de palabras. Cada nodo es un dict
+    palabra -> nodo; la clave _FIN_CONCEPTO marca el final de un concepto.
+    Se cachea, así que el diccionario se compila una sola vez por proceso.
+    """
+    raiz = {}
+    for concepto in conceptos:
+        nodo = raiz
+        for palabra in tokens_concepto(concepto):
+            nodo = nodo.setdefault(palabra, {})
+        if nodo is not raiz:
+            nodo.setdefault(_FIN_CONCEPTO, concepto)
+    return raiz
+
+
+def _concepto_mas_largo(raiz, palabras):
+    """Concepto más largo del trie con el que empieza la secuencia de palabras."""
+    nodo, encontrado = raiz, None
+    for palabra in palabras:
+        nodo = nodo.get(palabra)
+        if nodo is None:
+            break
+        encontrado = nodo.get(_FIN_CONCEPTO, encontrado)
+    return encontrado
+
+
+def clasificar_ing_gas(descripciones, conceptos=DICC_BANCARIO):
+    """
+    Devuelve, alineada con 'descripciones', la Serie con el concepto bancario
+    completo con el que empieza cada descripción (NaN si ninguno aplica).
+    Cada descripción distinta se evalúa una sola vez.
+    """
+    raiz = compilar_clasificador(tuple(conceptos))
+    mapa = {}
+    for desc in pd.unique(descripciones.dropna()):
+        if not isinstance(desc, str):
+            continue
+        concepto = _concepto_mas_largo(raiz, tokens_concepto(desc))
+        if concepto is not None:
+            mapa[desc] = concepto
+    return descripciones.map(mapa)
+
+
+
+# ==========================================================
+# 📄 REPORTE EXCEL DE CONCILIACIÓN
+# ==========================================================
+FORMATO_MONTO = '_(* #,##0.00_);_(* (#,##0.00);_(* "-"??_);_(@_)'
+
+TITULOS_BLOQUES = {
+    "abonos_contab_no_banco": "ABONOS EN CONTABILIDAD MAS NO EN EXTRACTOS (MENOS)",
+    "abonos_banco_no_contab": "ABONOS EN EXTRACTOS MAS NO EN CONTABILIDAD (MAS)",
+    "cargos_contab_no_banco": "CARGOS EN CONTABILIDAD MAS NO EN EXTRACTOS (MAS)",
+    "cargos_banco_no_contab": "CARGOS EN EXTRACTOS MAS NO EN CONTABILIDAD (MENOS)",
+    "ing_gas_consolidado": "INGRESOS / GASTOS BANCARIOS (MENOS)"
+}
+
+
+def _textos_fecha(fechas):
+    """Fechas del bloque como texto AAAA-MM-DD; vacío si no hay fecha."""
+    if pd.api.types.is_datetime64_any_dtype(fechas):
+        return fechas.dt.strftime("%Y-%m-%d").fillna("").tolist()
+    return ["" if pd.isna(f) else str(f) for f in fechas]
+
+
+def generar_excel_conciliacion(bloques, saldo_contabilidad, metadatos):
+    """
+    Genera el libro de conciliación con el cuadro de verificación y los bloques
+    de partidas con sus fórmulas. Devuelve un io.BytesIO listo para descargar.
+
+    Se escribe con xlsxwriter en modo constant_memory: cada fila se escribe una
+    sola vez, en orden y con su formato, y se descarta. Por eso la ubicación de
+    los bloques se calcula antes de escribir y las fórmulas ya salen completas.
+    """
+    output = io.BytesIO()
+    wb = xlsxwriter.Workbook(output, {"constant_memory": True})
+    ws = wb.add_worksheet("Conciliacion")
+    ws.hide_gridlines(2)
+    for col, ancho in enumerate([15, 80, 20]):
+        ws.set_column(col, col, ancho)
+
+    vino = "#800000"
+    mostaza = "#FFCC29"
+
+    # ==========================================================
+    # Ubicación de los bloques (filas de Excel, base 1)
+    # ==========================================================
+    # Cada bloque: fila en blanco, título con el subtotal, encabezado y partidas
+    # (al menos una fila). El subtotal suma desde la primera partida hasta la
+    # fila en blanco siguiente.
+    fila_saldo_contab, fila_saldo_partidas, fila_cifra_verif = 8, 9, 10
+    fila_saldo_extracto, fila_diferencia = 11, 12
+    filas_subtotal = {}
+    formulas_subtotal = {}
+    fila = fila_diferencia + 1
+    for clave in TITULOS_BLOQUES:
+        filas_subtotal[clave] = fila + 1
+        n = max(len(bloques[clave]), 1)
+        formulas_subtotal[clave] = f"=ABS(SUM(C{fila + 3}:C{fila + 3 + n}))"
+        fila += 3 + n
+
+    # ==========================================================
+    # Fila 1: Encabezado principal
+    # ==========================================================
+    grueso, doble = 2, 6
+    titulo = {"font_name": "Calibri", "bold": True, "font_size": 20, "align": "center",
+              "border_color": vino, "top": grueso, "bottom": doble}
+    ws.merge_range(0, 0, 0, 2, "CONCILIACIÓN BANCARIA", wb.add_format({**titulo, "left": grueso}))
+    ws.write_blank(0, 1, None, wb.add_format({"border_color": vino, "top": grueso, "bottom": doble}))
+    ws.write_blank(0, 2, None, wb.add_format({"border_color": vino, "top": grueso, "bottom": doble, "right": grueso}))
+
+    # ==========================================================
+    # Fila 2: Nombre empresa
+    # ==========================================================
+    empresa = {"font_name": "Calibri", "font_size": 16, "align": "center", "bg_color": "#EEEDC0",
+               "border_color": vino, "bottom": grueso}
+    ws.merge_range(1, 0, 1, 2, metadatos["nombre_empresa"], wb.add_format({**empresa, "left": grueso}))
+    ws.write_blank(1, 1, None, wb.add_format({"border_color": vino, "bottom": grueso}))
+    ws.write_blank(1, 2, None, wb.add_format({"border_color": vino, "bottom": grueso, "right": grueso}))
+
+    # ==========================================================
+    # Filas 3-6: Metadatos
+    # ==========================================================
+    relleno_vino = wb.add_format({"bg_color": vino, "align": "center"})
+    metadato = {"font_name": "Calibri", "font_size": 11, "bold": True, "font_color": "#FFFFFF",
+                "align": "right", "valign": "vcenter", "bg_color": vino}
+    fmt_etiqueta = wb.add_format(metadato)
+    fmt_valor = wb.add_format({**metadato, "num_format": FORMATO_MONTO})
+    fecha_actual = datetime.datetime.now().strftime("%d/%m/%Y")
+    for fila, (etiqueta, valor) in enumerate([
+        ("Mes", metadatos["mes"]),
+        ("Código contable", metadatos["codigo_contable"]),
+        ("ID Cuenta bancaria", metadatos["id_cuenta_bancaria"]),
+        ("Fecha de la conciliación", fecha_actual),
+    ], start=2):
+        ws.write_blank(fila, 0, None, relleno_vino)
+        ws.write_string(fila, 1, etiqueta, fmt_etiqueta)
+        ws.write(fila, 2, valor, fmt_valor if valor else fmt_etiqueta)
+
+    # ==========================================================
+    # Cuadro de verificación
+    # ==========================================================
+    cuadro = {"bold": True, "font_size": 14, "bg_color": mostaza, "bottom": 1, "bottom_color": vino}
+    fmt_cuadro_a = wb.add_format({**cuadro, "align": "center"})
+    fmt_cuadro = wb.add_format(cuadro)
+    fmt_cuadro_monto = wb.add_format({**cuadro, "num_format": FORMATO_MONTO})
+    formula_saldo_partidas = (
+        f"=-C{filas_subtotal['abonos_contab_no_banco']}+C{filas_subtotal['abonos_banco_no_contab']}"
+        f"+C{filas_subtotal['cargos_contab_no_banco']}-C{filas_subtotal['cargos_banco_no_contab']}"
+        f"-C{filas_subtotal['ing_gas_consolidado']}"
+    )
+    filas_cuadro = [
+        ("Concepto", "Monto"),
+        ("SALDO CONTABILIDAD", saldo_contabilidad),
+        ("SALDO PARTIDAS", formula_saldo_partidas),
+        ("CIFRA VERIFICACION", f"=C{fila_saldo_contab}+C{fila_saldo_partidas}"),
+        ("SALDO EXTRACTO", None),
+        ("DIFERENCIA", f"=C{fila_cifra_verif}-C{fila_saldo_extracto}"),
+    ]
+    for fila, (concepto, valor) in enumerate(filas_cuadro, start=6):
+        ws.write_blank(fila, 0, None, fmt_cuadro_a)
+        ws.write_string(fila, 1, concepto, fmt_cuadro)
+        if valor is None:
+            ws.write_blank(fila, 2, None, fmt_cuadro)
+        else:
+            ws.write(fila, 2, valor, fmt_cuadro_monto if valor else fmt_cuadro)
+
+    # ==========================================================
+    # Bloques de partidas
+    # ==========================================================
+    fmt_titulo = wb.add_format({"bold": True, "font_color": "#FFFFFF", "bg_color": vino, "align": "left"})
+    fmt_subtotal = wb.add_format({
+        "bold": True, "font_color": "#FFFFFF", "bg_color": vino, "align": "left", "num_format": FORMATO_MONTO
+    })
+    fmt_encabezado = wb.add_format({"bold": True, "align": "center"})
+    fmt_encabezado_monto = wb.add_format({"bold": True, "align": "center", "num_format": FORMATO_MONTO})
+    fmt_fecha = wb.add_format({"align": "center"})
+    fmt_monto = wb.add_format({"num_format": FORMATO_MONTO})
+
+    for clave, titulo_bloque in TITULOS_BLOQUES.items():
+        fila = filas_subtotal[clave] - 1
+        ws.write_string(fila, 0, titulo_bloque, fmt_titulo)
+        ws.write_blank(fila, 1, None, fmt_titulo)
+        ws.write_formula(fila, 2, formulas_subtotal[clave], fmt_subtotal)
+        ws.write_string(fila + 1, 0, "Fecha", fmt_encabezado)
+        ws.write_string(fila + 1, 1, "Descripción", fmt_encabezado)
+        ws.write_string(fila + 1, 2, "Monto", fmt_encabezado_monto)
+        fila += 2
+
+        df = bloques[clave]
+        if df.empty:
+            ws.write_string(fila, 1, "(Sin partidas registradas)")
+            ws.write_number(fila, 2, 0)
+            continue
+        fechas = _textos_fecha(df["fecha"]) if "fecha" in df else [""] * len(df)
+        descripciones = df["descripcion"].astype(str).tolist()
+        montos = df["monto"].to_numpy(dtype="float64").tolist()
+        for fecha, descripcion, monto in zip(fechas, descripciones, montos):
+            if fecha:
+                ws.write_string(fila, 0, fecha, fmt_fecha)
+            ws.write_string(fila, 1, descripcion)
+            ws.write_number(fila, 2, monto, fmt_monto if monto else None)
+            fila += 1
+
+    wb.close()
+    output.seek(0)
+    return output
+
+# ==========================================================
+# 🧮 FLUJO COMPLETO DE CONCILIACIÓN
+# ==========================================================
+MODO_EXACTO = "Monto exacto"
+MODO_TOLERANCIA = "Tolerancia y ventana de fechas"
+
+OPCIONES_CONCILIACION = {
+    "cruzar_referencias": True,
+    "modo_emparejamiento": MODO_EXACTO,
+    "priorizar_fechas": True,
+    "tolerancia_monto": 0.0,
+    "ventana_dias": 3,
+    "buscar_por_descripcion": False,
+    "similitud_descripcion": 0.3,
+    "porcentaje_monto_descripcion": 2.0,
+    "dias_descripcion": 5,
+    "buscar_agregados": False,
+    "max_partidas_agregado": 3,
+    "dias_agregado": 5,
+    "limite_segundos_agregado": 10.0,
+    "arrastrar_pendientes": False,
+    "dias_arrastre": 180,
+}
+
+
+def emparejar_partidas(df_contable, df_banco, opciones=None):
+    """
+    Ejecuta las etapas de emparejamiento configuradas en 'opciones'
+    (ver OPCIONES_CONCILIACION). Devuelve (pares, agregados): los pares de las
+    pasadas por referencia, por monto y por descripción (cuántos de la primera
+    y la última en pares.attrs["por_referencia"] y ["por_descripcion"]) y los
+    de la pasada de pagos agrupados (None si no se pidió).
+    """
+    opciones = {**OPCIONES_CONCILIACION, **(opciones or {})}
+
+    por_referencia = pares_vacios()
+    if opciones["cruzar_referencias"]:
+        por_referencia = emparejar_por_referencia(df_contable, df_banco)
+    contab_no_banco, banco_no_contab = separar_pendientes(df_contable, df_banco, por_referencia)
+
+    if opciones["modo_emparejamiento"] == MODO_EXACTO and opciones["priorizar_fechas"]:
+        pares = emparejar_por_monto_y_fecha(contab_no_banco, banco_no_contab)
+    elif opciones["modo_emparejamiento"] == MODO_EXACTO:
+        pares = emparejar_por_monto(contab_no_banco, banco_no_contab)
+    elif opciones["modo_emparejamiento"] == MODO_TOLERANCIA:
+        pares = emparejar_con_tolerancia(
+            contab_no_banco, banco_no_contab,
+            tolerancia=float(opciones["tolerancia_monto"]), dias=int(opciones["ventana_dias"])
+        )
+    else:
+        raise ValueError(f"Modo de emparejamiento desconocido: {opciones['modo_emparejamiento']!r}")
+    pares = pd.concat([por_referencia, pares], ignore_index=True)
+    pares.attrs["por_referencia"] = len(por_referencia)
+
+    if opciones["buscar_por_descripcion"]:
+        contab_no_banco, banco_no_contab = separar_pendientes(df_contable, df_banco, pares)
+        por_descripcion = emparejar_por_descripcion(
+            contab_no_banco, banco_no_contab,
+            similitud_minima=float(opciones["similitud_descripcion"]),
+            porcentaje_monto=float(opciones["porcentaje_monto_descripcion"]),
+            dias=int(opciones["dias_descripcion"])
+        )
+        pares = pd.concat([pares, por_descripcion], ignore_index=True)
+        pares.attrs = {"por_referencia": len(por_referencia), "por_descripcion": len(por_descripcion)}
+
+    agregados = None
+    if opciones["buscar_agregados"]:
+        contab_no_banco, banco_no_contab = separar_pendientes(df_contable, df_banco, pares)
+        agregados = emparejar_agregados(
+            contab_no_banco, banco_no_contab,
+            max_partidas=int(opciones["max_partidas_agregado"]),
+            dias=int(opciones["dias_agregado"]),
+            limite_segundos=float(opciones["limite_segundos_agregado"])
+        )
+    return pares, agregados
+
+
+def cargar_arrastre(df_contable, df_banco, cuenta, periodo, ruta_almacen=None, dias_maximos=180):
+    """
+    Primera pasada con el almacén local: carga las partidas que quedaron
+    abiertas en meses anteriores para la cuenta y las empareja (monto exacto,
+    fecha más cercana) con los movimientos nuevos del otro lado, siempre que
+    las fechas disten a lo sumo 'dias_maximos': un cheque viejo no se lleva el
+    primer movimiento nuevo del mismo monto. Las partidas sin fecha no se
+    arrastran a un par.
+    Devuelve (df_contable, df_banco, pares, posterior) con las partidas
+    arrastradas añadidas a cada lado con índices negativos y 'posterior' el
+    último periodo ya registrado después de este (None si no hay): en ese caso
+    el resultado del mes no se puede guardar (ver registrar_periodo).
+    """
+    con = conectar(ruta_almacen)
+    try:
+        arrastre_contab, arrastre_banco = cargar_abiertas(con, cuenta, periodo)
+        posterior = periodo_posterior(con, cuenta, periodo)
+    finally:
+        con.close()
+
+    pares = pd.concat([
+        emparejar_con_tolerancia(arrastre_contab, df_banco, dias=dias_maximos),
+        emparejar_con_tolerancia(df_contable, arrastre_banco, dias=dias_maximos),
+    ], ignore_index=True)
+    df_contable = concatenar_partidas([arrastre_contab, df_contable])
+    df_banco = concatenar_partidas([arrastre_banco, df_banco])
+    return df_contable, df_banco, pares, posterior
+
+
+def guardar_arrastre(df_contable, df_banco, pares, cuenta, periodo, ruta_almacen=None):
+    """
+    Registra en el almacén el resultado del periodo: cierra las partidas
+    arrastradas (índice negativo) que quedaron en algún par y guarda como
+    abiertas las partidas nuevas pendientes. Devuelve cuántas se cerraron.
+    """
+    contab_no_banco, banco_no_contab = separar_pendientes(df_contable, df_banco, pares)
+    indices = pd.to_numeric(pd.concat([pares["idx_contab"], pares["idx_banco"]]))
+    ids_cerradas = (-indices[indices < 0]).tolist()
+
+    con = conectar(ruta_almacen)
+    try:
+        registrar_periodo(
+            con, cuenta, periodo, ids_cerradas,
+            contab_no_banco[contab_no_banco.index >= 0], banco_no_contab[banco_no_contab.index >= 0]
+        )
+    finally:
+        con.close()
+    return len(ids_cerradas)
+
+
+def _con_monto(df):
+    """Agrega la columna 'monto' en pesos a partir de los centavos (solo para reportar)."""
+    return df.assign(monto=df["centavos"] / 100)
+
+
+def clasificar_partidas(df_contable, df_banco, pares):
+    """
+    Separa las partidas pendientes en los bloques del reporte. Devuelve un dict
+    con 'abonos_contab_no_banco', 'abonos_banco_no_contab', 'cargos_contab_no_banco',
+    'cargos_banco_no_contab' e 'ing_gas_consolidado', cada uno con la columna
+    'monto' en pesos.
+
+    Los ingresos/gastos bancarios se retiran de los bloques y se consolidan por
+    descripción. La clasificación se hace sobre las categorías de descripción y
+    cada bloque es una selección de las pendientes, sin copias intermedias.
+    """
+    contab_no_banco, banco_no_contab = separar_pendientes(df_contable, df_banco, pares)
+    bloques, ing_gas = {}, []
+    for df, abonos, cargos in (
+        (contab_no_banco, "abonos_contab_no_banco", "cargos_contab_no_banco"),
+        (banco_no_contab, "abonos_banco_no_contab", "cargos_banco_no_contab"),
+    ):
+        centavos = df["centavos"].to_numpy()
+        es_ing_gas = clasificar_ing_gas(df["descripcion"]).notna().to_numpy() & (centavos != 0)
+        ing_gas.append(df[es_ing_gas])
+        bloques[abonos] = _con_monto(df[(centavos > 0) & ~es_ing_gas])
+        bloques[cargos] = _con_monto(df[(centavos < 0) & ~es_ing_gas])
+
+    ing_gas = concatenar_partidas(ing_gas)
+    ing_gas_consolidado = (
+        ing_gas.groupby("descripcion", observed=True, as_index=False)["centavos"].sum()
+        .sort_values("descripcion", key=lambda d: d.astype(str))
+    )
+    ing_gas_consolidado["descripcion"] = ing_gas_consolidado["descripcion"].astype(str)
+    ing_gas_consolidado = _con_monto(ing_gas_consolidado).reset_index(drop=True)
+    ing_gas_consolidado["fecha"] = ""
+    bloques["ing_gas_consolidado"] = ing_gas_consolidado
+    return bloques
+
+
+def _claves_orden(serie):
+    """Valores para ordenar una columna; las categorías se ordenan por su texto."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        categorias = serie.cat.categories
+        return serie.cat.reorder_categories(categorias.sort_values()).cat.codes.to_numpy()
+    return serie.to_numpy()
+
+
+def consultar_partidas(df, texto="", monto_min=None, monto_max=None, fecha_desde=None, fecha_hasta=None,
+                       orden=None, descendente=False, pagina=1, tamano_pagina=100):
+    """
+    Filtra, ordena y pagina un bloque de partidas sin copiarlo completo: los
+    filtros y el orden se resuelven sobre posiciones y solo se materializan las
+    filas de la página pedida.
+
+    'texto' busca en la descripción (sin distinguir mayúsculas), 'monto_min' y
+    'monto_max' acotan el valor absoluto del monto y las fechas son inclusivas;
+    None o vacío no filtra. Devuelve un dict con 'pagina' (DataFrame), 'filas'
+    (partidas que cumplen los filtros), 'suma' (suma de sus montos) y 'paginas'.
+    """
+    mascara = np.ones(len(df), dtype=bool)
+    if texto:
+        descripciones = df["descripcion"]
+        if isinstance(descripciones.dtype, pd.CategoricalDtype):
+            # Se busca una vez por categoría; el código -1 (sin descripción) cae en el False final
+            en_categoria = descripciones.cat.categories.astype(str).str.contains(texto, case=False, regex=False)
+            mascara &= np.append(np.asarray(en_categoria, dtype=bool), False)[descripciones.cat.codes.to_numpy()]
+        else:
+            coincide = descripciones.astype(str).str.contains(texto, case=False, regex=False)
+            mascara &= coincide.to_numpy(dtype=bool)
+    montos = np.abs(df["monto"].to_numpy(dtype="float64"))
+    if monto_min is not None:
+        mascara &= montos >= monto_min
+    if monto_max is not None:
+        mascara &= montos <= monto_max
+    if "fecha" in df and pd.api.types.is_datetime64_any_dtype(df["fecha"]):
+        if fecha_desde is not None:
+            mascara &= (df["fecha"] >= pd.Timestamp(fecha_desde)).to_numpy()
+        if fecha_hasta is not None:
+            mascara &= (df["fecha"] < pd.Timestamp(fecha_hasta) + pd.Timedelta(days=1)).to_numpy()
+
+    posiciones = np.flatnonzero(mascara)
+    if orden:
+        claves = _claves_orden(df[orden])[posiciones]
+        secuencia = np.argsort(claves, kind="stable")
+        posiciones = posiciones[secuencia[::-1] if descendente else secuencia]
+
+    filas = len(posiciones)
+    paginas = max(1, -(-filas // tamano_pagina))
+    pagina = min(max(int(pagina), 1), paginas)
+    inicio = (pagina - 1) * tamano_pagina
+    return {
+        "pagina": df.iloc[posiciones[inicio:inicio + tamano_pagina]],
+        "filas": filas,
+        "suma": float(df["monto"].to_numpy(dtype="float64")[posiciones].sum()),
+        "paginas": paginas,
+    }
+
+
+def calcular_saldo_contable(df_contable_raw, df_contable):
+    """
+    Saldo contable: último valor de la columna 'saldo movimiento' si existe,
+    si no la suma de los montos. Devuelve (saldo, tomado_de_columna).
+    """
+    col_saldo_mov = buscar_columna(df_contable_raw, "saldo movimiento")
+    if col_saldo_mov:
+        saldo_series = parsear_montos(df_contable_raw[col_saldo_mov])[0].dropna()
+        if not saldo_series.empty:
+            return saldo_series.iloc[-1], True
+    return df_contable["centavos"].sum() / 100, False
+
+
+def conciliar(archivo_contab, archivo_banco, opciones=None, ruta_almacen=None):
+    """
+    Conciliación completa sin interfaz: carga, normaliza, empareja, clasifica
+    y genera el Excel. Los archivos son objetos tipo archivo con atributo
+    'name' (los del uploader de Streamlit, io.BytesIO con nombre o archivos
+    abiertos en modo binario). Con la opción 'arrastrar_pendientes' usa el
+    almacén local de 'ruta_almacen' (por defecto almacen_utils.RUTA_ALMACEN).
+    Los conteos de cada etapa quedan en el resultado para armar los mensajes
+    (ver mensajes_conciliacion).
+    """
+    opciones = {**OPCIONES_CONCILIACION, **(opciones or {})}
+
+    df_contable_raw, metadatos = cargar_auxiliar_contable(archivo_contab)
+    df_contable_raw.columns = [limpiar_columna(str(c)) for c in df_contable_raw.columns]
+
+    df_contable, info_contable = normalizar_contabilidad(df_contable_raw)
+    df_banco, info_banco = cargar_extracto(archivo_banco)
+
+    saldo_contabilidad, saldo_de_columna = calcular_saldo_contable(df_contable_raw, df_contable)
+
+    cuenta = metadatos["id_cuenta_bancaria"]
+    periodo = periodo_de_fecha(info_contable["ultima_fecha"])
+    arrastre_omitido = bool(opciones["arrastrar_pendientes"]) and (cuenta == "NO DISPONIBLE" or periodo is None)
+    arrastre = bool(opciones["arrastrar_pendientes"]) and not arrastre_omitido
+    pares_arrastre, periodo_posterior_registrado = pares_vacios(), None
+    if arrastre:
+        df_contable, df_banco, pares_arrastre, periodo_posterior_registrado = cargar_arrastre(
+            df_contable, df_banco, cuenta, periodo, ruta_almacen, dias_maximos=int(opciones["dias_arrastre"])
+        )
+
+    pares, agregados = emparejar_partidas(*separar_pendientes(df_contable, df_banco, pares_arrastre), opciones)
+    por_referencia = pares.attrs.get("por_referencia", 0)
+    por_descripcion = pares.attrs.get("por_descripcion", 0)
+    por_monto = len(pares) - por_referencia - por_descripcion
+    pares = pd.concat([pares_arrastre, pares] + ([agregados] if agregados is not None else []), ignore_index=True)
+    bloques = clasificar_partidas(df_contable, df_banco, pares)
+    if arrastre and periodo_posterior_registrado is None:
+        guardar_arrastre(df_contable, df_banco, pares, cuenta, periodo, ruta_almacen)
+
+    return {
+        "opciones": opciones,
+        "metadatos": metadatos,
+        "info_contable": info_contable,
+        "info_banco": info_banco,
+        "registros_contables": len(df_contable_raw),
+        "registros_banco": info_banco["registros"],
+        "periodo": periodo,
+        "arrastre": arrastre,
+        "arrastre_omitido": arrastre_omitido,
+        "periodo_posterior": periodo_posterior_registrado,
+        "arrastradas_contab": int((df_contable.index < 0).sum()),
+        "arrastradas_banco": int((df_banco.index < 0).sum()),
+        "partidas_conciliadas": len(pares),
+        "partidas_arrastradas_conciliadas": len(pares_arrastre),
+        "por_referencia": por_referencia,
+        "por_monto": por_monto,
+        "por_descripcion": por_descripcion,
+        "agregados_contab": None if agregados is None else agregados["idx_contab"].nunique(),
+        "agregados_banco": None if agregados is None else agregados["idx_banco"].nunique(),
+        "tiempo_agotado": bool(agregados is not None and agregados.attrs.get("tiempo_agotado")),
+        "bloques": bloques,
+        "saldo_contabilidad": saldo_contabilidad,
+        "saldo_de_columna": saldo_de_columna,
+        "excel": generar_excel_conciliacion(bloques, saldo_contabilidad, metadatos),
+    }
+
+
+def mensajes_conciliacion(resultado):
+    """
+    Mensajes del proceso a partir del resultado de conciliar(), como lista de
+    (tipo, texto) con tipo 'success', 'info' o 'warning' (los nombres de las
+    funciones de Streamlit que los muestran).
+    """
+    opciones = resultado["opciones"]
+    info_contable = resultado["info_contable"]
+    info_banco = resultado["info_banco"]
+    mensajes = [
+        ("success", f"✅ Archivo de contabilidad cargado: {resultado['registros_contables']} registros"),
+        ("success", f"✅ Extracto bancario cargado: {resultado['registros_banco']} registros"),
+    ]
+
+    if info_contable["col_fecha"]:
+        mensajes.append(("info", f"📅 Columna de fecha detectada: '{info_contable['col_fecha']}' (formato: {info_contable['formato_fecha']})"))
+    else:
+        mensajes.append(("warning", "⚠️ No se encontró columna de fecha en contabilidad"))
+    if info_contable["ultima_fecha"] is not None:
+        mensajes.append(("info", f"📆 Última fecha contable: {info_contable['ultima_fecha'].strftime('%d/%m/%Y')}"))
+
+    mensajes.append(("info", f"📅 Fechas del extracto en columna '{info_banco['col_fecha']}' (formato: {info_banco['formato_fecha']})"))
+    mensajes.append(("info", f"🧾 Perfil del extracto: {info_banco['perfil']}"))
+    for origen, info in (("contabilidad", info_contable), ("el extracto", info_banco)):
+        if info["montos_no_convertidos"]:
+            mensajes.append(("warning", f"⚠️ {info['montos_no_convertidos']} montos de {origen} no se pudieron interpretar y se omiten"))
+
+    if resultado["saldo_de_columna"]:
+        mensajes.append(("info", f"💰 Saldo contable: ${resultado['saldo_contabilidad']:,.2f}"))
+
+    if resultado["arrastre_omitido"]:
+        mensajes.append(("warning", "⚠️ Sin ID de cuenta bancaria o fecha contable: no se usan los pendientes guardados"))
+    if resultado["arrastre"]:
+        mensajes.append((
+            "info",
+            f"📦 Pendientes de meses anteriores: {resultado['arrastradas_contab']} contables y "
+            f"{resultado['arrastradas_banco']} bancarios; {resultado['partidas_arrastradas_conciliadas']} conciliados este mes"
+        ))
+
+    if opciones["cruzar_referencias"]:
+        mensajes.append(("info", f"🔖 Partidas conciliadas por referencia y monto: {resultado['por_referencia']}"))
+    mensajes.append(("info", f"🔗 Partidas conciliadas por monto: {resultado['por_monto']}"))
+    if opciones["buscar_por_descripcion"]:
+        mensajes.append(("info", f"🔤 Partidas conciliadas por descripción: {resultado['por_descripcion']}"))
+
+    if resultado["agregados_contab"] is not None:
+        mensajes.append((
+            "info",
+            f"🧩 Pagos agrupados: {resultado['agregados_contab']} partidas contables y "
+            f"{resultado['agregados_banco']} movimientos bancarios conciliados en grupo"
+        ))
+        if resultado["tiempo_agotado"]:
+            mensajes.append(("warning", "⏱️ Se alcanzó el tiempo máximo de búsqueda de pagos agrupados; el resultado es parcial"))
+
+    if resultado["arrastre"] and resultado["periodo_posterior"]:
+        mensajes.append((
+            "warning",
+            f"⚠️ La cuenta ya tiene registrado {resultado['periodo_posterior']}: los pendientes de "
+            f"{resultado['periodo']} no se guardan para no reabrir partidas cerradas en meses posteriores"
+        ))
+    elif resultado["arrastre"]:
+        mensajes.append(("info", f"🗄️ Pendientes de {resultado['periodo']} guardados para la cuenta {resultado['metadatos']['id_cuenta_bancaria']}"))
+    return mensajes
+
+
+# ==========================================================
+# 📦 CONCILIACIÓN POR LOTES
+# ==========================================================
+def archivo_en_memoria(nombre, contenido):
+    """io.BytesIO con atributo 'name', como los archivos del uploader."""
+    archivo = io.BytesIO(contenido)
+    archivo.name = nombre
+    return archivo
+
+
+def leer_metadatos_contables(archivo):
+    """Lee solo el bloque de encabezado del auxiliar contable (sin cargar los datos)."""
+    return extraer_metadatos_contables(_filas_iniciales(archivo, FILAS_METADATOS_CONTABLES))
+
+
+def _corresponde_a_cuenta(digitos_cuenta, nombre_extracto):
+    """
+    True si el nombre del extracto identifica la cuenta. Cada número del nombre
+    (grupos de dígitos, unidos si van separados solo por guiones, como en
+    "4567-123456-78") se compara entero: debe ser la cuenta completa o, con al
+    menos 4 dígitos, su final. Fechas y consecutivos del nombre no se mezclan.
+    """
+    numeros = (re.sub(r"\D", "", n) for n in re.findall(r"\d+(?:-\d+)*", nombre_extracto))
+    return any(n == digitos_cuenta or (len(n) >= 4 and digitos_cuenta.endswith(n)) for n in numeros)
+
+
+def emparejar_archivos_por_cuenta(cuentas, nombres_extractos):
+    """
+    Empareja auxiliares contables con extractos por el ID de cuenta bancaria
+    del encabezado contable (fila 10) buscado en el nombre del extracto.
+
+    'cuentas' es una lista de (nombre_auxiliar, id_cuenta_bancaria) y
+    'nombres_extractos' la lista de nombres de los extractos, ambas en el orden
+    en que se subieron. Devuelve (parejas, sin_pareja): parejas es una lista de
+    (posición_auxiliar, posición_extracto), de modo que archivos con el mismo
+    nombre no se confunden, y sin_pareja una lista de (nombre_archivo, motivo).
+    Solo se empareja cuando la coincidencia es única en ambos sentidos.
+    """
+    candidatos = []
+    for _, id_cuenta in cuentas:
+        digitos = re.sub(r"\D", "", str(id_cuenta))
+        candidatos.append(
+            [j for j, n in enumerate(nombres_extractos) if _corresponde_a_cuenta(digitos, n)] if digitos else []
+        )
+
+    reclamados = {}
+    for i, extractos in enumerate(candidatos):
+        for j in extractos:
+            reclamados.setdefault(j, []).append(i)
+
+    parejas, sin_pareja = [], []
+    for i, extractos in enumerate(candidatos):
+        nombre_contab, id_cuenta = cuentas[i]
+        if not extractos:
+            sin_pareja.append((nombre_contab, f"Sin extracto para la cuenta {id_cuenta}"))
+        elif len(extractos) > 1:
+            nombres = ", ".join(nombres_extractos[j] for j in extractos)
+            sin_pareja.append((nombre_contab, f"Varios extractos posibles: {nombres}"))
+        elif len(reclamados[extractos[0]]) > 1:
+            sin_pareja.append(
+                (nombre_contab, f"El extracto {nombres_extractos[extractos[0]]} coincide con varias cuentas")
+            )
+        else:
+            parejas.append((i, extractos[0]))
+
+    emparejados = {j for _, j in parejas}
+    for j, nombre_banco in enumerate(nombres_extractos):
+        if j not in emparejados and j not in reclamados:
+            sin_pareja.append((nombre_banco, "Ningún auxiliar contable corresponde a este extracto"))
+    return parejas, sin_pareja
+
+
+def _resumen_conciliacion(resultado):
+    """Fila del resumen de lote a partir del resultado de conciliar()."""
+    bloques = resultado["bloques"]
+    return {
+        "Empresa": resultado["metadatos"]["nombre_empresa"],
+        "Mes": resultado["metadatos"]["mes"],
+        "Código contable": resultado["metadatos"]["codigo_contable"],
+        "ID Cuenta bancaria": resultado["metadatos"]["id_cuenta_bancaria"],
+        "Partidas conciliadas": resultado["partidas_conciliadas"],
+        "Saldo contable": resultado["saldo_contabilidad"],
+        "Abonos Contab. no Banco": abs(bloques["abonos_contab_no_banco"]["monto"].sum()),
+        "Abonos Banco no Contab.": abs(bloques["abonos_banco_no_contab"]["monto"].sum()),
+        "Cargos Contab. no Banco": abs(bloques["cargos_contab_no_banco"]["monto"].sum()),
+        "Cargos Banco no Contab.": abs(bloques["cargos_banco_no_contab"]["monto"].sum()),
+        "Ingresos/Gastos Bancarios": abs(bloques["ing_gas_consolidado"]["monto"].sum()),
+    }
+
+
+def conciliar_trabajo(nombre_contab, contenido_contab, nombre_banco, contenido_banco, opciones=None):
+    """
+    Concilia una pareja de archivos dados como bytes. Pensada para ejecutarse
+    en un proceso aparte: recibe y devuelve solo datos serializables y nunca
+    lanza; los errores quedan en la clave 'error'.
+    """
+    salida = {"Auxiliar contable": nombre_contab, "Extracto": nombre_banco, "error": None, "excel": None}
+    try:
+        resultado = conciliar(
+            archivo_en_memoria(nombre_contab, contenido_contab),
+            archivo_en_memoria(nombre_banco, contenido_banco),
+            opciones
+        )
+        salida.update(_resumen_conciliacion(resultado))
+        salida["excel"] = resultado["excel"].getvalue()
+    except Exception as e:
+        salida["error"] = f"{type(e).__name__}: {e}"
+    return salida
+
+
+def conciliar_lote(trabajos, opciones=None, max_procesos=None):
+    """
+    Concilia en paralelo una lista de trabajos (nombre_contab, bytes_contab,
+    nombre_banco, bytes_banco) con un pool de procesos. Genera los resultados
+    de conciliar_trabajo() a medida que terminan.
+    """
+    if not trabajos:
+        return
+    max_procesos = min(len(trabajos), max_procesos or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_procesos) as pool:
+        futuros = [pool.submit(conciliar_trabajo, *trabajo, opciones) for trabajo in trabajos]
+        for futuro in as_completed(futuros):
+            yield futuro.result()
+
+
+def _nombre_seguro(texto):
+    return re.sub(r"[^\w.-]+", "_", str(texto)).strip("_") or "SIN_NOMBRE"
+
+
+def empaquetar_lote(resultados, sin_pareja=()):
+    """
+    Arma el ZIP del lote: un Excel de conciliación por cuenta y
+    'Resumen_lote.xlsx' con una fila por pareja procesada y por archivo sin pareja.
+    Devuelve (zip io.BytesIO, DataFrame del resumen).
+    """
+    filas, usados = [], set()
+    salida = io.BytesIO()
+    with zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED) as zf:
+        for res in sorted(resultados, key=lambda r: r["Auxiliar contable"]):
+            fila = {k: v for k, v in res.items() if k not in ("excel", "error")}
+            if res["error"]:
+                fila["Estado"] = f"Error: {res['error']}"
+            else:
+                base = f"Conciliacion_{_nombre_seguro(res['ID Cuenta bancaria'])}_{_nombre_seguro(res['Mes'])}"
+                nombre, n = f"{base}.xlsx", 1
+                while nombre in usados:
+                    n += 1
+                    nombre = f"{base}_{n}.xlsx"
+                usados.add(nombre)
+                zf.writestr(nombre, res["excel"])
+                fila["Archivo"] = nombre
+                fila["Estado"] = "OK"
+            filas.append(fila)
+        for nombre_archivo, motivo in sin_pareja:
+            filas.append({"Archivo sin pareja": nombre_archivo, "Estado": motivo})
+
+        resumen = pd.DataFrame(filas)
+        libro = io.BytesIO()
+        resumen.to_excel(libro, sheet_name="Resumen", index=False, engine="openpyxl")
+        zf.writestr("Resumen_lote.xlsx", libro.getvalue())
+
+    salida.seek(0)
+    return salida, resumen
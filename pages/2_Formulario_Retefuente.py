@@ -1,7 +1,6 @@
 import streamlit as st
 import pandas as pd
 import re
-import unicodedata
 from openpyxl import Workbook
 from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
@@ -12,6 +11,12 @@ import traceback
 import zipfile
 import io
 from ui_utils import aplicar_css_global
+from almacen_utils import cargar_terceros, guardar_terceros
+from texto_utils import normalizar_texto
+from retefuente_utils import (
+    mascara_auxiliar, mascara_patrones, clasificar_conceptos, cargar_catalogo,
+    valor_formulario_350
+)
 
 # ==========================================================
 # 🔐 VERIFICACIÓN DE AUTENTICACIÓN
@@ -52,33 +57,6 @@ with st.sidebar:
         st.session_state.username = None
         st.switch_page("Home.py")
 
-# ==========================================================
-# 🔧 FUNCIONES AUXILIARES
-# ==========================================================
-def norm_txt(s: str) -> str:
-    """Normaliza texto (minúsculas, sin tildes, sin espacios dobles)."""
-    if pd.isna(s):
-        return ""
-    s = str(s).strip().lower()
-    s = unicodedata.normalize("NFKD", s)
-    s = "".join(ch for ch in s if not unicodedata.combining(ch))
-    return s
-
-def contiene_alguna(texto, patrones):
-    """✅ Verifica si el texto contiene todas las palabras de algún patrón."""
-    t = norm_txt(texto)
-    for patron in patrones:
-        subpalabras = patron.split()
-        if all(sp in t for sp in subpalabras):
-            return True
-    return False
-
-def es_auxiliar(fila) -> bool:
-    """Evalúa si la cuenta contable es auxiliar."""
-    nivel = norm_txt(fila.get("Nivel", ""))
-    trx = norm_txt(fila.get("Transaccional", ""))
-    return ("aux" in nivel) or (trx in {"si", "sí", "yes", "true", "1"})
-
 # ==========================================================
 # 🎨 ESTILOS
 # ==========================================================
@@ -153,6 +131,10 @@ if st.button("⚙️ Generar Formularios 350", type="primary", use_container_wid
 
         archivos_generados = []
 
+        # Decisiones PJ/PN de terceros ya vistos en corridas anteriores
+        terceros = cargar_terceros()
+        terceros_conocidos = len(terceros)
+
         for idx, balance_file in enumerate(uploaded_balances, start=1):
             status_text.text(f"📘 Procesando archivo {idx}/{archivos_totales}: {balance_file.name}")
 
@@ -197,7 +179,7 @@ if st.button("⚙️ Generar Formularios 350", type="primary", use_container_wid
                 try:
                     if datos_generales_cache and "Tarifas" in datos_generales_cache:
                         tarifas_df = datos_generales_cache["Tarifas"]
-                        tarifas_df.columns = [norm_txt(c) for c in tarifas_df.columns]
+                        tarifas_df.columns = [normalizar_texto(c) for c in tarifas_df.columns]
 
                         col_nit = next((c for c in tarifas_df.columns if "nit" in c), None)
                         col_ciiu = next((c for c in tarifas_df.columns if "ciiu" in c), None)
@@ -264,18 +246,12 @@ if st.button("⚙️ Generar Formularios 350", type="primary", use_container_wid
                 # ==========================================================
                 # 🔹 FUNCIÓN PARA GENERAR CONCEPTOS
                 # ==========================================================
-                def generar_concepto_multitarifa(nombre_concepto, palabras_incluir, fila_out, tasas):
-                    df = raw.copy()
-                    mask_aux = df.apply(es_auxiliar, axis=1)
-                    mask_cod = df["Código cuenta contable"].astype(str).str.startswith("2365")
-                    mask_nombre = df["Nombre cuenta contable"].astype(str).apply(lambda x: contiene_alguna(x, palabras_incluir))
-                    mask_excluir = df["Nombre tercero"].astype(str).apply(lambda x: contiene_alguna(x, ["dian", "direccion", "impuesto", "aduana"]))
-                    filtrado = df[mask_aux & mask_cod & mask_nombre & (~mask_excluir)].copy()
-
-                    filtrado["__retencion__"] = (
-                        pd.to_numeric(filtrado["Movimiento crédito"], errors="coerce").fillna(0)
-                        - pd.to_numeric(filtrado["Movimiento débito"], errors="coerce").fillna(0)
-                    )
+                def generar_concepto_multitarifa(nombre_concepto, filtrado, fila_out, tasas):
+                    t1, t2 = tasas
+
+                    # Sin tarifas las columnas F-I solo llevan la retención: las filas en cero no se escriben
+                    if not t1 and not t2:
+                        filtrado = filtrado[filtrado["__retencion__"] != 0]
 
                     if filtrado.empty:
                         ws.cell(row=fila_out, column=1, value=nombre_concepto).font = negro_negrita
@@ -300,62 +276,21 @@ if st.button("⚙️ Generar Formularios 350", type="primary", use_container_wid
                         fila_out += 1
                         return fila_out
 
-                    patrones_pj = [
-                        r"\bsas\b",
-                        r"\bs\.a\.\b",
-                        r"\bltda\b",
-                        r"empresa",
-                        r"sociedad",
-                        r"\bsc\b",
-                        r"\bsca\b",
-                        r"\bcompania\b",
-                        r"\bcomandita\b",
-                        r"fundacion",
-                        r"universidad",
-                        r"\bcia\b",
-                        r"\bltda\b",
-                        r"\blimitada\b",
-                        r"\bresponsabilidad limitada\b",
-                        r"\bsimple y por acciones\b",
-                        r"\bs\.?a\.?\b",
-                        r"\bs\.?a\.?s\.?\b",
-                        r"\bltda\.?\b",
-                        r"centro",
-                        r"instituto",
-                        r"\basociaci[oó]n\b",
-                        r"\bconsorcio\b",
-                        r"alianza",
-                        r"\bc[aá]mara\b",
-                        r"holding",
-                        r"grupo",
-                        r"constructora",
-                        r"\bsimple y por acciones\b",
-                        r"\bs\.?c\.?a\.?\b",
-                        r"\bs\.?c\.?s\.?\b",
-                        r"\bs\.?e\.?\b",
-                        r"\bentidad sin animo de lucro\b",
-                        r"union temporal",
-                        r"inversiones",
-                        r"fiduciaria"
-                    ]
-
-                    filtrado["es_pj"] = filtrado["Nombre tercero"].astype(str).apply(
-                        lambda x: any(re.search(p, norm_txt(x)) for p in patrones_pj)
-                    )
-
-                    t1 = tasas[0]["tasa"] if len(tasas) > 0 else None
-                    t2 = tasas[1]["tasa"] if len(tasas) > 1 else None
-
                     ws.cell(row=fila_out, column=1, value=nombre_concepto).font = negro_negrita
                     fila_out += 1
                     fila_inicio = fila_out
 
-                    for _, r in filtrado.iterrows():
-                        id_val = str(r["Identificación"]).replace(".0", "")
-                        nom_cta = str(r["Nombre cuenta contable"])
-                        nom_ter = str(r["Nombre tercero"])
-                        cod_cta = str(r["Código cuenta contable"])
-                        retencion = float(r["__retencion__"])
+                    filas = zip(
+                        filtrado["Código cuenta contable"].tolist(), filtrado["Nombre cuenta contable"].tolist(),
+                        filtrado["Identificación"].tolist(), filtrado["Nombre tercero"].tolist(),
+                        filtrado["__retencion__"].tolist(), filtrado["es_pj"].tolist()
+                    )
+                    for cod_cta, nom_cta, id_val, nom_ter, retencion, es_pj in filas:
+                        id_val = str(id_val).replace(".0", "")
+                        nom_cta = str(nom_cta)
+                        nom_ter = str(nom_ter)
+                        cod_cta = str(cod_cta)
+                        retencion = float(retencion)
 
                         ws.cell(row=fila_out, column=2, value=cod_cta)
                         ws.cell(row=fila_out, column=3, value=nom_cta)
@@ -366,17 +301,13 @@ if st.button("⚙️ Generar Formularios 350", type="primary", use_container_wid
                             ws.cell(row=fila_out, column=6, value=f"=G{fila_out}/{t1}")
                         else:
                             ws.cell(row=fila_out, column=6, value=0)
-                        ws.cell(row=fila_out, column=7, value=retencion if r["es_pj"] else 0)
+                        ws.cell(row=fila_out, column=7, value=retencion if es_pj else 0)
 
                         if t2 is not None and t2 != 0:
                             ws.cell(row=fila_out, column=8, value=f"=I{fila_out}/{t2}")
                         else:
                             ws.cell(row=fila_out, column=8, value=0)
-                        ws.cell(row=fila_out, column=9, value=retencion if not r["es_pj"] else 0)
-
-                        valores = [ws.cell(row=fila_out, column=c).value for c in range(6, 10)]
-                        if all(v in [0, None, ""] for v in valores):
-                            continue
+                        ws.cell(row=fila_out, column=9, value=retencion if not es_pj else 0)
 
                         for col in range(1, 10):
                             c = ws.cell(row=fila_out, column=col)
@@ -406,28 +337,14 @@ if st.button("⚙️ Generar Formularios 350", type="primary", use_container_wid
                 # ==========================================================
                 # 🔹 GENERAR TODOS LOS CONCEPTOS
                 # ==========================================================
-                fila_out = 10
+                # Máscara de auxiliares y reparto de las cuentas 2365 por concepto en una sola pasada
+                catalogo = cargar_catalogo()
+                auxiliares = mascara_auxiliar(raw)
+                filas_por_concepto = clasificar_conceptos(raw, catalogo, auxiliares, terceros)
 
-                fila_out = generar_concepto_multitarifa("Rentas de trabajo", ["salario", "pago laboral"], fila_out, tasas=[])
-                fila_out = generar_concepto_multitarifa("Rentas de pensiones", ["pension"], fila_out, tasas=[])
-                fila_out = generar_concepto_multitarifa("Honorarios", ["honorario", "consultoria"], fila_out, tasas=[{'tasa': 0.11}, {'tasa': 0.10}])
-                fila_out = generar_concepto_multitarifa("Comisiones", ["comision", "comisiones"], fila_out, tasas=[{'tasa': 0.11}, {'tasa': 0.10}])
-                fila_out = generar_concepto_multitarifa("Servicios 1% (transporte de carga, empresas de servicios temporales (sobre AIU))", ["servicio 1", "servicio 1%", "transporte de carga", "carga", "servicio temporal aiu"], fila_out, tasas=[{'tasa': 0.01}, {'tasa': 0.01}])
-                fila_out = generar_concepto_multitarifa("Servicios 2% (vigilancia, aseo, IPS, salud)", ["servicio 2", "vigilancia", "aseo", "vigilancia aiu", "aseo aiu","ips", "salud"], fila_out, tasas=[{'tasa': 0.02}, {'tasa': 0.02}])
-                fila_out = generar_concepto_multitarifa("Servicios 3,5% (transporte pasajero, hotel, restaurante, licencia, software)", ["servicio 3,5", "servicio 3.5", "transporte pasajero", "pasajero", "hotel", "restaurante", "licencia", "derecho","software"], fila_out, tasas=[{'tasa': 0.035}, {'tasa': 0.035}])
-                fila_out = generar_concepto_multitarifa("Servicios generales", ["servicio 4", "servicio general 4", "servicio declarante", "servicio 6", "servicio general 6", "servicio no declarante", "servicio general no declarante"], fila_out, tasas=[{'tasa': 0.04}, {'tasa': 0.06}])
-                fila_out = generar_concepto_multitarifa("Rendimientos financieros e intereses", ["rendimiento", "rendimiento financiero", "intereses"], fila_out, tasas=[{'tasa': 0.07}, {'tasa': 0.07}])
-                fila_out = generar_concepto_multitarifa("Arrendamientos muebles", ["arrendamiento mueble", "mueble"], fila_out, tasas=[{'tasa': 0.04}, {'tasa': 0.04}])
-                fila_out = generar_concepto_multitarifa("Arrendamientos inmuebles", ["arrendamiento inmueble", "inmueble", "casa", "apartamento"], fila_out, tasas=[{'tasa': 0.035}, {'tasa': 0.035}])
-                fila_out = generar_concepto_multitarifa("Regalías y explotación de la propiedad intelectual", ["regalia", "propiedad intelectual", "explitacion"], fila_out, tasas=[{'tasa': 0.02}, {'tasa': 0.02}])
-                fila_out = generar_concepto_multitarifa("Dividendos y participaciones", ["dividendo", "participacion"], fila_out, tasas=[])
-                fila_out = generar_concepto_multitarifa("Compras generales", ["compra 2,5", "compra 2.5", "compra general 2,5", "compra general 2.5", "compra general declarante", "compra 3,5", "compra 3.5", "compra general 3,5", "compra general 3.5", "compra general no declarante"], fila_out, tasas=[{'tasa': 0.025}, {'tasa': 0.035}])
-                fila_out = generar_concepto_multitarifa("Compras combustible", ["combustible", "gasolina"], fila_out, tasas=[{'tasa': 0.001}, {'tasa': 0.001}])
-                fila_out = generar_concepto_multitarifa("Compras de bienes raíces para uso vivienda (por las primeras 10.000 UVT)", ["inmueble 1", "bienes raices 1", "menos 10.000 uvt", "vivienda 1"], fila_out, tasas=[{'tasa': 0.01}, {'tasa': 0.01}])
-                fila_out = generar_concepto_multitarifa("Compras de bienes raíces para uso vivienda (exceso de las primeras 10.000 UVT)", ["compra inmueble 2,5%", "inmueble 2,5%", "bienes raices 2,5%", "vivienda 2,5%", "compra inmueble 2.5%", "inmueble 2.5%", "bienes raices 2.5%", "vivienda 2.5%", "retencion 2.5%", "mas 10.000 uvt"], fila_out, tasas=[{'tasa': 0.025}, {'tasa': 0.025}])
-                fila_out = generar_concepto_multitarifa("Compras de bienes raíces para uso distinto a vivienda de habitación", ["compra inmueble distinto vivienda", "inmueble no habitacion", "bienes raices no habitacion", "vivienda no habitacion", "no habitacion"], fila_out, tasas=[{'tasa': 0.025}, {'tasa': 0.025}])
-                fila_out = generar_concepto_multitarifa("Contratos de construcción", ["contrato construccion", "contruccion"], fila_out, tasas=[{'tasa': 0.02}, {'tasa': 0.02}])
-                fila_out = generar_concepto_multitarifa("Otros pagos sujetos a retención", ["otros ingresos", "otros pagos", "otros tributacion"], fila_out, tasas=[{'tasa': 0.025}, {'tasa': 0.035}])
+                fila_out = 10
+                for concepto, filtrado in zip(catalogo["conceptos"], filas_por_concepto):
+                    fila_out = generar_concepto_multitarifa(concepto["nombre"], filtrado, fila_out, concepto["tasas"])
 
                 # ==========================================================
                 # 🟦 AUTORRETENCIÓN
@@ -445,13 +362,9 @@ if st.button("⚙️ Generar Formularios 350", type="primary", use_container_wid
                     except Exception:
                         tarifa = None
 
-                    def normalizar(s):
-                        s = str(s).strip().lower()
-                        return ''.join(ch for ch in unicodedata.normalize('NFKD', s) if not unicodedata.combining(ch))
-
                     def buscar_columna(keyword, keyword2=None):
                         for c in raw.columns:
-                            nombre = normalizar(c)
+                            nombre = normalizar_texto(c)
                             if keyword in nombre and (keyword2 is None or keyword2 in nombre):
                                 return c
                         return None
@@ -644,10 +557,10 @@ if st.button("⚙️ Generar Formularios 350", type="primary", use_container_wid
                 # 🔹 RESPONSABLES DEL IMPUESTO SOBRE LAS VENTAS
                 # ==========================================================
                 def generar_concepto_responsables_impuesto_ventas(fila_out, df_balance):
-                    mask_aux = df_balance.apply(es_auxiliar, axis=1)
+                    mask_aux = auxiliares
                     mask_codigo = df_balance["Código cuenta contable"].astype(str).str.startswith("2367")
                     patrones = ["impuesto a las ventas retenido", "retenido 15"]
-                    mask_nombre = df_balance["Nombre cuenta contable"].astype(str).apply(lambda x: contiene_alguna(x, patrones))
+                    mask_nombre = mascara_patrones(df_balance["Nombre cuenta contable"], patrones)
                     filtrado = df_balance[mask_aux & mask_codigo & mask_nombre].copy()
 
                     if filtrado.empty:
@@ -1042,12 +955,12 @@ if st.button("⚙️ Generar Formularios 350", type="primary", use_container_wid
                 ocultar_filas_con_formulas_cero(ws)
 
                 # ==========================================================
-                # 🧩 COPIAR HOJA Y CREAR FORMULARIO_350
+                # 🧩 CREAR FORMULARIO_350
                 # ==========================================================
-                def generar_formulario_350_inicial(wb):
-                    if "Detalle_350" not in wb.sheetnames:
-                        return
-
+                # Formulario_350 es Detalle_350 una fila más abajo, bajo una fila técnica
+                # oculta. Se emite en una sola pasada: cada celda sale con su valor final
+                # (valor_formulario_350) y comparte el estilo de la celda de origen.
+                def generar_formulario_350(wb):
                     ws_origen = wb["Detalle_350"]
                     ws_nueva = wb.create_sheet("Formulario_350")
 
@@ -1058,30 +971,26 @@ if st.button("⚙️ Generar Formularios 350", type="primary", use_container_wid
                     for col, texto in enumerate(encabezados, start=1):
                         ws_nueva.cell(row=1, column=col, value=texto).font = Font(bold=True, color="000000")
 
+                    filas_subtotal = []
                     for row in ws_origen.iter_rows():
                         for cell in row:
-                            try:
-                                new_cell = ws_nueva.cell(row=cell.row + 1, column=cell.col_idx, value=cell.value)
-                                if cell.has_style:
-                                    new_cell.font = copy(cell.font)
-                                    new_cell.fill = copy(cell.fill)
-                                    new_cell.border = copy(cell.border)
-                                    new_cell.alignment = copy(cell.alignment)
-                                    new_cell.number_format = cell.number_format
-                            except AttributeError:
+                            if isinstance(cell, openpyxl.cell.cell.MergedCell):
                                 continue
+                            new_cell = ws_nueva.cell(
+                                row=cell.row + 1, column=cell.column, value=valor_formulario_350(cell.value)
+                            )
+                            if cell.has_style:
+                                new_cell._style = copy(cell._style)
+                            if (cell.column == 1 and isinstance(cell.value, str)
+                                    and cell.value.strip().lower().startswith("subtotal ")):
+                                filas_subtotal.append(cell.row + 1)
 
                     for merged_range in ws_origen.merged_cells.ranges:
-                        coords = str(merged_range)
-                        letras, numeros = [], []
-                        for c in coords.replace(":", " ").split():
-                            col = ''.join([ch for ch in c if ch.isalpha()])
-                            row = ''.join([ch for ch in c if ch.isdigit()])
-                            letras.append(col)
-                            numeros.append(int(row) + 1)
-                        rango_nuevo = f"{letras[0]}{numeros[0]}:{letras[1]}{numeros[1]}"
                         try:
-                            ws_nueva.merge_cells(rango_nuevo)
+                            ws_nueva.merge_cells(
+                                start_row=merged_range.min_row + 1, start_column=merged_range.min_col,
+                                end_row=merged_range.max_row + 1, end_column=merged_range.max_col
+                            )
                         except ValueError:
                             pass
 
@@ -1092,23 +1001,39 @@ if st.button("⚙️ Generar Formularios 350", type="primary", use_container_wid
                         if dim.height:
                             ws_nueva.row_dimensions[row_idx + 1].height = dim.height
 
-                    for row_dim in ws_nueva.row_dimensions.values():
-                        row_dim.hidden = False
+                    # Los subtotales del formulario se muestran sin "Subtotal", sin relleno ni negrita
+                    for row in filas_subtotal:
+                        texto = ws_nueva.cell(row=row, column=1).value.strip()[len("Subtotal "):].strip()
+                        if texto:
+                            texto = texto[0].upper() + texto[1:]
+                        ws_nueva.cell(row=row, column=1, value=texto)
+
+                        for col in range(1, 10):
+                            celda = ws_nueva.cell(row=row, column=col)
+                            celda.fill = PatternFill(fill_type=None)
+                            celda.font = Font(
+                                name=celda.font.name,
+                                size=celda.font.size,
+                                color=celda.font.color,
+                                bold=False,
+                                italic=celda.font.italic
+                            )
 
+                    ws_nueva.row_dimensions[1].hidden = True
                     ws_nueva.column_dimensions.group("B", "E", hidden=True, outline_level=1)
                     ws_nueva.sheet_view.showOutlineSymbols = True
                     ws_nueva.sheet_view.outline_summary_right = True
                     ws_nueva.sheet_view.showRowColHeaders = True
 
-                generar_formulario_350_inicial(wb)
+                generar_formulario_350(wb)
 
                 # ==========================================================
                 # 🧩 AGRUPAR Y COLAPSAR FILAS
                 # ==========================================================
+                # Los bloques se buscan en Detalle_350, que conserva los textos "Subtotal ...",
+                # y se colapsan en Formulario_350 una fila más abajo.
                 def agrupar_colapsar_formulario_350(wb):
-                    if "Formulario_350" not in wb.sheetnames:
-                        return
-
+                    ws_origen = wb["Detalle_350"]
                     ws = wb["Formulario_350"]
 
                     def encontrar_filas(ws, inicio_texto, fin_texto):
@@ -1130,22 +1055,22 @@ if st.button("⚙️ Generar Formularios 350", type="primary", use_container_wid
                             return
 
                         for row in range(fila_inicio, fila_fin + 1):
-                            val = ws.cell(row=row, column=1).value
+                            val = ws_origen.cell(row=row, column=1).value
                             texto = str(val).strip().lower() if val else ""
 
                             if texto == "" or not texto.startswith("subtotal"):
-                                ws.row_dimensions[row].outlineLevel = 1
-                                ws.row_dimensions[row].hidden = True
+                                ws.row_dimensions[row + 1].outlineLevel = 1
+                                ws.row_dimensions[row + 1].hidden = True
 
                     inicio1, fin1 = encontrar_filas(
-                        ws,
+                        ws_origen,
                         "rentas de trabajo",
                         "subtotal menos retenciones practicadas en exceso"
                     )
                     aplicar_colapso(ws, inicio1, fin1)
 
                     inicio2, fin2 = encontrar_filas(
-                        ws,
+                        ws_origen,
                         "a responsables del impuesto sobre las ventas",
                         "subtotal retenciones practicadas en exceso"
                     )
@@ -1156,71 +1081,6 @@ if st.button("⚙️ Generar Formularios 350", type="primary", use_container_wid
 
                 agrupar_colapsar_formulario_350(wb)
 
-                # ==========================================================
-                # 🧩 AJUSTE DE FÓRMULAS (+1 FILA)
-                # ==========================================================
-                def ajustar_todas_las_referencias(wb, hoja="Formulario_350"):
-                    if hoja not in wb.sheetnames:
-                        return
-
-                    ws = wb[hoja]
-                    patron = re.compile(r"(\$?[A-Z]+)(\d+)")
-
-                    for row in ws.iter_rows():
-                        for cell in row:
-                            valor = cell.value
-                            if isinstance(valor, str) and valor.strip().startswith("="):
-                                nuevo_valor = patron.sub(
-                                    lambda m: f"{m.group(1)}{int(m.group(2)) + 1}", valor
-                                )
-                                if nuevo_valor != valor:
-                                    cell.value = nuevo_valor
-
-                ajustar_todas_las_referencias(wb)
-
-                # ==========================================================
-                # 🧩 REESCRIBIR FÓRMULAS CON PARÉNTESIS
-                # ==========================================================
-                def reescribir_formulas_con_parentesis_form350(wb):
-                    hoja = "Formulario_350"
-
-                    if hoja not in wb.sheetnames:
-                        return
-
-                    ws = wb[hoja]
-
-                    for row in ws.iter_rows():
-                        for cell in row:
-                            valor = cell.value
-                            if isinstance(valor, str) and valor.strip().startswith("="):
-                                contenido = valor[1:].strip()
-                                if not (contenido.startswith("(") and contenido.endswith(")")):
-                                    cell.value = f"=({contenido})"
-
-                reescribir_formulas_con_parentesis_form350(wb)
-
-                # ==========================================================
-                # 🧩 REDONDEAR AL MÚLTIPLO DE MIL
-                # ==========================================================
-                def redondear_multiplo_mil_formulario_350(wb):
-                    hoja = "Formulario_350"
-                    if hoja not in wb.sheetnames:
-                        return
-
-                    ws = wb[hoja]
-
-                    for row in ws.iter_rows():
-                        for cell in row:
-                            valor = cell.value
-                            if isinstance(valor, str) and valor.strip().startswith("="):
-                                contenido = valor[1:].strip()
-                                if "MROUND" not in contenido.upper():
-                                    cell.value = f"=MROUND({contenido},1000)"
-                            elif isinstance(valor, (int, float)) and valor != 0:
-                                cell.value = f"=MROUND({valor},1000)"
-
-                redondear_multiplo_mil_formulario_350(wb)
-
                 # ==========================================================
                 # 🧩 AGREGAR BALANCE ORIGINAL (desde fila 8 en adelante)
                 # ==========================================================
@@ -1316,42 +1176,8 @@ if st.button("⚙️ Generar Formularios 350", type="primary", use_container_wid
 
                 agregar_hoja_balance_original(wb, balance_file)
 
-                # ==========================================================
-                # 🧩 AJUSTES FINALES EN FORMULARIO_350
-                # ==========================================================
-                def ajustar_formulario_350_final(wb, nombre_empresa):
-                    if "Formulario_350" not in wb.sheetnames:
-                        return
-
-                    ws = wb["Formulario_350"]
-
-                    for row in range(1, ws.max_row + 1):
-                        valor = ws.cell(row=row, column=1).value
-                        if not valor or not isinstance(valor, str):
-                            continue
-
-                        texto = valor.strip()
-                        if texto.lower().startswith("subtotal "):
-                            nuevo_texto = texto[len("Subtotal "):].strip()
-                            if nuevo_texto:
-                                nuevo_texto = nuevo_texto[0].upper() + nuevo_texto[1:]
-                            ws.cell(row=row, column=1, value=nuevo_texto)
-
-                            for col in range(1, 10):
-                                celda = ws.cell(row=row, column=col)
-                                celda.fill = PatternFill(fill_type=None)
-                                celda.font = Font(
-                                    name=celda.font.name,
-                                    size=celda.font.size,
-                                    color=celda.font.color,
-                                    bold=False,
-                                    italic=celda.font.italic
-                                )
-
-                    ws.row_dimensions[1].hidden = True
-                    wb._sheets.sort(key=lambda s: 0 if s.title == "Formulario_350" else 1)
-
-                ajustar_formulario_350_final(wb, nombre_empresa)
+                # Formulario_350 como primera hoja del libro
+                wb._sheets.sort(key=lambda s: 0 if s.title == "Formulario_350" else 1)
 
                 # ==========================================================
                 # 💾 GUARDAR ARCHIVO EN MEMORIA
@@ -1381,6 +1207,12 @@ if st.button("⚙️ Generar Formularios 350", type="primary", use_container_wid
                 st.code(traceback.format_exc())
                 continue
 
+        if len(terceros) > terceros_conocidos:
+            try:
+                guardar_terceros(terceros)
+            except OSError as e:
+                st.warning(f"⚠️ No se pudo guardar el registro de terceros: {e}")
+
         # ==========================================================
         # 🎉 MOSTRAR RESULTADOS Y DESCARGAS
         # ==========================================================
@@ -1479,7 +1311,7 @@ with st.expander("🧩 Características del Formulario"):
     ### ✨ Funcionalidades incluidas:
 
     - Cálculo automático de retenciones por concepto
-    - Clasificación automática entre personas jurídicas y naturales
+    - Clasificación automática entre personas jurídicas y naturales (por NIT, terceros ya registrados y nombre)
     - Búsqueda de tarifas personalizadas por NIT
     - Cálculo de autorretención (Art. 114-1 E.T.)
     - Inclusión de retenciones de IVA
@@ -9,6 +9,7 @@ import io
 import zipfile
 from datetime import datetime
 from ui_utils import aplicar_css_global
+from texto_utils import normalizar_serie
 
 # ==========================================================
 # 🔐 VERIFICACIÓN DE AUTENTICACIÓN
@@ -58,9 +59,6 @@ def normalize_nit(s):
     m = re.match(r"(\d+)", s)
     return m.group(1) if m else ""
 
-def normalizar_texto(s):
-    return ''.join(c for c in unicodedata.normalize('NFD', str(s).lower()) if unicodedata.category(c) != 'Mn')
-
 def redondear_mil(valor):
     return round(valor / 1000) * 1000 if pd.notna(valor) else 0
 
@@ -302,15 +300,17 @@ if st.button("⚙️ Generar Formularios SIMPLE", type="primary", use_container_
                 celda_valor.number_format = '_-* #,##0_-;-* #,##0_-;_-* "-"??_-;_-@_-'
             
             # PASO 6: Aportes pensiones
-            def es_aporte_pension(row):
-                cod = str(row["Código cuenta contable"]).strip()
-                nivel = str(row["Nivel"]).strip().lower()
-                nombre = normalizar_texto(str(row["Nombre cuenta contable"]))
-                return (nivel == "auxiliar"
-                        and (cod.startswith("5") or cod.startswith("6"))
-                        and ("aporte" in nombre and "pension" in nombre))
-            
-            aportes = balance_aux[balance_aux.apply(es_aporte_pension, axis=1)]
+            nombres_cuenta = normalizar_serie(balance_aux["Nombre cuenta contable"])
+            codigos_cuenta = balance_aux["Código cuenta contable"].astype(str).str.strip()
+            es_auxiliar = balance_aux["Nivel"].astype(str).str.strip().str.lower() == "auxiliar"
+
+            es_aporte_pension = (
+                es_auxiliar
+                & codigos_cuenta.str.startswith(("5", "6"))
+                & nombres_cuenta.str.contains("aporte", regex=False).astype(bool)
+                & nombres_cuenta.str.contains("pension", regex=False).astype(bool)
+            )
+            aportes = balance_aux[es_aporte_pension]
             aporte_valor = redondear_mil(aportes["Movimiento débito"].sum() - aportes["Movimiento crédito"].sum())
             
             filas6 = {
@@ -368,70 +368,68 @@ if st.button("⚙️ Generar Formularios SIMPLE", type="primary", use_container_
                 celda_valor.number_format = '_-* #,##0_-;-* #,##0_-;_-* "-"??_-;_-@_-'
             
             # PASO 8: Liquidación IVA
-            def es_iva_generado(row):
-                cod = str(row["Código cuenta contable"]).strip()
-                nombre = str(row["Nombre cuenta contable"]).lower()
-                return (
-                    cod.startswith("2408")
-                    and any(p in nombre for p in [
-                        "iva generado", "iva generado en ventas", "iva generado por servicios",
-                        "iva ventas nacionales", "iva ventas gravadas",
-                        "iva por operaciones gravadas", "iva en operaciones gravadas",
-                        "iva generado 19", "iva generado 5",
-                        "iva generado y por pagar", "iva causado ventas",
-                        "iva causado por ventas", "iva causado en operaciones gravadas",
-                        "iva generado operaciones gravadas", "iva generado ventas 19",
-                        "iva generado servicios 19", "iva generado ventas gravadas 19",
-                        "iva causado ventas nacionales", "iva causado servicios",
-                        "iva generado por operaciones", "iva generado por ventas nacionales",
-                        "iva generado por operaciones gravadas", "iva generado por ventas 19",
-                        "iva devolucion en compras", "iva dev compras",
-                        "iva devolucion en compras 19", "iva devolucion en compras 5",
-                        "iva devolucion en servicios", "iva devolucion en servicios 19",
-                        "iva devolucion en servicios 5", "devolucion descontable por servicios",
-                        "devolucion descontable por servicios 19", "devolucion descontable por servicios 5"
-                    ])
-                )
-            
-            def es_iva_descontable(row):
-                cod = str(row["Código cuenta contable"]).strip()
-                nombre = str(row["Nombre cuenta contable"]).lower()
+            PATRONES_IVA_GENERADO = [
+                "iva generado", "iva generado en ventas", "iva generado por servicios",
+                "iva ventas nacionales", "iva ventas gravadas",
+                "iva por operaciones gravadas", "iva en operaciones gravadas",
+                "iva generado 19", "iva generado 5",
+                "iva generado y por pagar", "iva causado ventas",
+                "iva causado por ventas", "iva causado en operaciones gravadas",
+                "iva generado operaciones gravadas", "iva generado ventas 19",
+                "iva generado servicios 19", "iva generado ventas gravadas 19",
+                "iva causado ventas nacionales", "iva causado servicios",
+                "iva generado por operaciones", "iva generado por ventas nacionales",
+                "iva generado por operaciones gravadas", "iva generado por ventas 19",
+                "iva devolucion en compras", "iva dev compras",
+                "iva devolucion en compras 19", "iva devolucion en compras 5",
+                "iva devolucion en servicios", "iva devolucion en servicios 19",
+                "iva devolucion en servicios 5", "devolucion descontable por servicios",
+                "devolucion descontable por servicios 19", "devolucion descontable por servicios 5"
+            ]
+            PATRONES_IVA_DESCONTABLE = [
+                "iva descontable", "iva descontable en compras", "iva descontable por compras",
+                "iva descontable por servicios", "descontable por servicios",
+                "iva descontable compras nacionales", "iva descontable por compras 19%",
+                "iva descontable compras gravadas", "iva compras", "iva compras nacionales",
+                "iva compras gravadas", "iva servicios", "iva servicios 19",
+                "iva compras 19", "iva descontable 19", "iva descontable importaciones",
+                "descontable por devoluciones 19%", "descontable por devoluciones servicios",
+                "descontable por devoluciones", "iva descontable por compras 5%"
+            ]
+
+            def mascara_cuentas(df, prefijo, patrones):
+                """Por fila: el código empieza por 'prefijo' y el nombre normalizado contiene algún patrón."""
+                nombres = normalizar_serie(df["Nombre cuenta contable"])
+                patron = "|".join(re.escape(p) for p in patrones)
                 return (
-                    cod.startswith("2408")
-                    and any(p in nombre for p in [
-                        "iva descontable", "iva descontable en compras", "iva descontable por compras",
-                        "iva descontable por servicios", "descontable por servicios",
-                        "iva descontable compras nacionales", "iva descontable por compras 19%",
-                        "iva descontable compras gravadas", "iva compras", "iva compras nacionales",
-                        "iva compras gravadas", "iva servicios", "iva servicios 19",
-                        "iva compras 19", "iva descontable 19", "iva descontable importaciones",
-                        "descontable por devoluciones 19%", "descontable por devoluciones servicios",
-                        "descontable por devoluciones", "iva descontable por compras 5%"
-                    ])
+                    df["Código cuenta contable"].astype(str).str.strip().str.startswith(prefijo)
+                    & nombres.str.contains(patron).astype(bool)
                 )
-            
+
             def calcular_retenciones_iva(balance_aux):
-                def _norm(s):
-                    s = str(s).lower()
-                    s = ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
-                    return s
-                
+                nombres = normalizar_serie(balance_aux["Nombre cuenta contable"])
+                retenidas = (
+                    balance_aux["Código cuenta contable"].astype(str).str.startswith("135517")
+                    & (balance_aux["Nivel"].astype(str).str.strip().str.lower() == "auxiliar")
+                )
                 debitos = balance_aux[
-                    (balance_aux["Código cuenta contable"].astype(str).str.startswith("135517")) &
-                    (balance_aux["Nivel"].astype(str).str.lower().str.strip() == "auxiliar") &
-                    (balance_aux["Nombre cuenta contable"].apply(lambda x: "impuesto a las ventas retenido" in _norm(x)))
+                    retenidas
+                    & nombres.str.contains("impuesto a las ventas retenido", regex=False).astype(bool)
                 ]
                 creditos = balance_aux[
-                    (balance_aux["Código cuenta contable"].astype(str).str.startswith("135517")) &
-                    (balance_aux["Nivel"].astype(str).str.lower().str.strip() == "auxiliar") &
-                    (balance_aux["Nombre cuenta contable"].apply(lambda x: "devolucion impuesto a las ventas retenido" in _norm(x)))
+                    retenidas
+                    & nombres.str.contains("devolucion impuesto a las ventas retenido", regex=False).astype(bool)
                 ]
                 total_debito = debitos["Movimiento débito"].sum()
                 total_credito = creditos["Movimiento crédito"].sum()
                 return redondear_mil(total_debito - total_credito)
             
-            iva_generado = redondear_mil(balance_aux[balance_aux.apply(es_iva_generado, axis=1)]["Movimiento crédito"].sum())
-            iva_descontable = redondear_mil(balance_aux[balance_aux.apply(es_iva_descontable, axis=1)]["Movimiento débito"].sum())
+            iva_generado = redondear_mil(
+                balance_aux[mascara_cuentas(balance_aux, "2408", PATRONES_IVA_GENERADO)]["Movimiento crédito"].sum()
+            )
+            iva_descontable = redondear_mil(
+                balance_aux[mascara_cuentas(balance_aux, "2408", PATRONES_IVA_DESCONTABLE)]["Movimiento débito"].sum()
+            )
             retenciones_iva = calcular_retenciones_iva(balance_aux)
             
             filas8 = {
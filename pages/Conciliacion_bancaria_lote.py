@@ -0,0 +1,184 @@
+import streamlit as st
+import datetime
+import os
+from ui_utils import aplicar_css_global
+from conciliacion_ui_utils import opciones_conciliacion
+from conciliacion_utils import (
+    archivo_en_memoria, leer_metadatos_contables, emparejar_archivos_por_cuenta,
+    conciliar_lote, empaquetar_lote
+)
+
+# ==========================================================
+# 🔐 VERIFICACIÓN DE AUTENTICACIÓN
+# ==========================================================
+if 'autenticado' not in st.session_state:
+    st.session_state.autenticado = False
+
+if not st.session_state.autenticado:
+    st.error("🔒 Debes iniciar sesión primero")
+    st.info("👈 Ve a la página principal para autenticarte")
+    st.stop()
+
+# ==========================================================
+# 🎨 APLICAR ESTILOS GLOBALES
+# ==========================================================
+aplicar_css_global()
+
+# ==========================================================
+# 🏛 CONFIGURACIÓN DE PÁGINA
+# ==========================================================
+st.set_page_config(
+    page_title="Conciliación Bancaria por Lotes",
+    layout="wide",
+    page_icon="🏦"
+)
+
+st.title("🏦 Conciliación Bancaria por Lotes")
+st.markdown("---")
+
+# ==========================================================
+# 🧭 SIDEBAR CON INFORMACIÓN DE USUARIO
+# ==========================================================
+with st.sidebar:
+    st.markdown("---")
+    st.success(f"👤 Usuario: **{st.session_state.username}**")
+    if st.button("🚪 Cerrar Sesión", key="logout_conciliacion_lote"):
+        st.session_state.autenticado = False
+        st.session_state.username = None
+        st.switch_page("Home.py")
+
+# ==========================================================
+# 📤 INTERFAZ DE CARGA DE ARCHIVOS
+# ==========================================================
+col1, col2 = st.columns(2)
+
+with col1:
+    st.subheader("📊 Auxiliares Contables")
+    uploaded_contabs = st.file_uploader(
+        "Sube los archivos 'Movimiento auxiliar por cuenta contable'",
+        type=["xlsx", "csv"],
+        key="contabilidad_lote",
+        accept_multiple_files=True,
+        help="Un auxiliar por cuenta bancaria; la cuenta se toma del encabezado (fila 10)"
+    )
+
+with col2:
+    st.subheader("🏦 Extractos Bancarios")
+    uploaded_bancos = st.file_uploader(
+        "Sube los extractos bancarios",
+        type=["xlsx", "csv"],
+        key="banco_lote",
+        accept_multiple_files=True,
+        help="El nombre de cada extracto debe contener el número de cuenta o sus últimos dígitos"
+    )
+
+st.markdown("---")
+
+opciones = opciones_conciliacion()
+
+max_procesos = st.number_input(
+    "Procesos en paralelo", min_value=1, max_value=os.cpu_count() or 1, value=os.cpu_count() or 1, step=1,
+    help="Cantidad de conciliaciones que se ejecutan al mismo tiempo"
+)
+
+st.markdown("---")
+
+# ==========================================================
+# ⚙️ BOTÓN DE PROCESAMIENTO
+# ==========================================================
+if st.button("⚙️ Generar Conciliaciones del Lote", type="primary", use_container_width=True):
+
+    if not uploaded_contabs:
+        st.error("⚠️ Por favor sube al menos un auxiliar contable")
+        st.stop()
+
+    if not uploaded_bancos:
+        st.error("⚠️ Por favor sube al menos un extracto bancario")
+        st.stop()
+
+    try:
+        # ==========================================================
+        # 🔗 EMPAREJAMIENTO DE ARCHIVOS POR CUENTA
+        # ==========================================================
+        # Auxiliares y extractos se guardan por separado y por posición: dos archivos
+        # con el mismo nombre no se pisan
+        contenidos_contab = [archivo.getvalue() for archivo in uploaded_contabs]
+        contenidos_banco = [archivo.getvalue() for archivo in uploaded_bancos]
+        cuentas = [
+            (archivo.name, leer_metadatos_contables(archivo_en_memoria(archivo.name, contenido))["id_cuenta_bancaria"])
+            for archivo, contenido in zip(uploaded_contabs, contenidos_contab)
+        ]
+
+        parejas, sin_pareja = emparejar_archivos_por_cuenta(cuentas, [a.name for a in uploaded_bancos])
+        st.info(f"🔗 Parejas auxiliar/extracto encontradas: {len(parejas)}")
+        for nombre_archivo, motivo in sin_pareja:
+            st.warning(f"⚠️ {nombre_archivo}: {motivo}")
+
+        if not parejas:
+            st.error("❌ No se pudo emparejar ningún auxiliar con su extracto")
+            st.stop()
+
+        # ==========================================================
+        # ⚙️ CONCILIACIÓN EN PARALELO
+        # ==========================================================
+        trabajos = [
+            (uploaded_contabs[i].name, contenidos_contab[i], uploaded_bancos[j].name, contenidos_banco[j])
+            for i, j in parejas
+        ]
+        progreso = st.progress(0.0, text="⏳ Conciliando cuentas...")
+        resultados = []
+        for resultado in conciliar_lote(trabajos, opciones, max_procesos=int(max_procesos)):
+            resultados.append(resultado)
+            progreso.progress(
+                len(resultados) / len(trabajos),
+                text=f"⏳ Conciliadas {len(resultados)} de {len(trabajos)} cuentas"
+            )
+        progreso.empty()
+
+        errores = [r for r in resultados if r["error"]]
+        for r in errores:
+            st.error(f"❌ {r['Auxiliar contable']}: {r['error']}")
+
+        zip_lote, resumen = empaquetar_lote(resultados, sin_pareja)
+        st.success(f"✅ {len(resultados) - len(errores)} conciliaciones generadas correctamente")
+
+        # ==========================================================
+        # 📊 RESUMEN DEL LOTE
+        # ==========================================================
+        st.markdown("---")
+        st.subheader("📊 Resumen del Lote")
+        st.dataframe(resumen, use_container_width=True)
+
+        # ==========================================================
+        # 📥 DESCARGA DEL ARCHIVO
+        # ==========================================================
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        st.download_button(
+            label="📦 Descargar Conciliaciones (ZIP)",
+            data=zip_lote,
+            file_name=f"Conciliaciones_Bancarias_{timestamp}.zip",
+            mime="application/zip",
+            use_container_width=True,
+            type="primary"
+        )
+
+    except Exception as e:
+        st.error(f"❌ Error durante el procesamiento: {str(e)}")
+        st.exception(e)
+
+# ==========================================================
+# 📖 INFORMACIÓN ADICIONAL
+# ==========================================================
+with st.expander("📘 Instrucciones de Uso"):
+    st.markdown("""
+    ### 🏦 Cómo usar la Conciliación por Lotes:
+
+    1. **📊 Auxiliares Contables:** sube un “Movimiento auxiliar por cuenta contable” por cada cuenta,
+       tal como se descarga del sistema. El ID de la cuenta bancaria se lee del encabezado (fila 10).
+    2. **🏦 Extractos:** sube los extractos; el nombre de cada archivo debe contener el número de la
+       cuenta (con o sin guiones) o sus últimos dígitos, por ejemplo `Extracto 4567-123456-78.xlsx`
+       o `extracto_5678.xlsx`.
+    3. **⚙️ Procesamiento:** cada pareja se concilia en un proceso aparte con las mismas reglas de la
+       conciliación individual. Los archivos sin pareja o ambiguos se reportan y no se procesan.
+    4. **📥 Descarga:** el ZIP contiene una conciliación por cuenta y el archivo `Resumen_lote.xlsx`.
+    """)
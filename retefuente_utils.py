@@ -0,0 +1,189 @@
+import functools
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+from texto_utils import factorizar_normalizado, normalizar_serie
+
+# ==========================================================
+# 🔧 FILTROS SOBRE EL BALANCE
+# ==========================================================
+VALORES_SI = {"si", "sí", "yes", "true", "1"}
+
+
+def compilar_patrones(patrones):
+    """Patrones de palabras ("servicio 3,5", ...) como tuplas de palabras listas para buscar."""
+    return tuple(tuple(patron.split()) for patron in patrones)
+
+
+def _coincidencias(textos, patrones):
+    """
+    Máscara sobre 'textos' (ya normalizados): True si el texto contiene todas
+    las palabras de algún patrón de compilar_patrones().
+    """
+    textos = pd.Series(textos, dtype=object)
+    coincide = np.zeros(len(textos), dtype=bool)
+    for palabras in patrones:
+        todas = np.ones(len(textos), dtype=bool)
+        for palabra in palabras:
+            todas &= textos.str.contains(palabra, regex=False).to_numpy(dtype=bool)
+        coincide |= todas
+    return coincide
+
+
+def mascara_patrones(serie, patrones):
+    """✅ Por fila: el texto normalizado contiene todas las palabras de algún patrón."""
+    codigos, textos = factorizar_normalizado(serie)
+    return pd.Series(_coincidencias(textos, compilar_patrones(patrones))[codigos], index=serie.index)
+
+
+def mascara_auxiliar(df):
+    """Por fila: la cuenta contable es auxiliar (nivel auxiliar o marcada como transaccional)."""
+    nivel = normalizar_serie(df["Nivel"])
+    trx = normalizar_serie(df["Transaccional"])
+    return nivel.str.contains("aux", regex=False).astype(bool) | trx.isin(VALORES_SI)
+
+
+# ==========================================================
+# 📚 CATÁLOGO DE CONCEPTOS
+# ==========================================================
+# Los conceptos del formulario 350 (nombres, patrones, tarifas PJ/PN), los
+# terceros excluidos y los patrones de persona jurídica viven en un JSON
+# versionado junto al código; las tarifas de un nuevo año gravable se cambian
+# ahí. El catálogo se compila una vez por proceso: un lote de empresas no
+# vuelve a armar patrones por archivo.
+
+RUTA_CATALOGO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "retefuente_conceptos.json")
+
+
+@functools.lru_cache(maxsize=None)
+def cargar_catalogo(ruta=None):
+    """
+    Lee y compila el catálogo: patrones de palabras como tuplas, patrones de
+    persona jurídica en una sola expresión regular y tarifas como (pj, pn).
+    """
+    with open(ruta or RUTA_CATALOGO, encoding="utf-8") as f:
+        datos = json.load(f)
+    return {
+        "version": datos["version"],
+        "anio_gravable": datos["anio_gravable"],
+        "terceros_excluidos": compilar_patrones(datos["terceros_excluidos"]),
+        "patron_pj": re.compile("|".join(f"(?:{p})" for p in datos["patrones_persona_juridica"])),
+        "conceptos": [
+            {
+                "nombre": c["nombre"],
+                "patrones": compilar_patrones(c["patrones"]),
+                "tasas": (c["tasa_pj"], c["tasa_pn"]),
+            }
+            for c in datos["conceptos"]
+        ],
+    }
+
+
+# ==========================================================
+# 🏢 PERSONAS JURÍDICAS
+# ==========================================================
+def digitos_identificacion(identificaciones):
+    """Solo los dígitos de la identificación, sin el dígito de verificación tras '-' ni un '.0' final."""
+    return (
+        identificaciones.astype(object).fillna("").astype(str)
+        .str.replace(r"\.0$", "", regex=True)
+        .str.split("-").str[0]
+        .str.replace(r"\D", "", regex=True)
+    )
+
+
+def mascara_persona_juridica(nombres_tercero, identificaciones=None, terceros=None, patron_pj=None):
+    """
+    Por fila: el tercero es persona jurídica. Decide en este orden:
+    1. NIT de persona jurídica: 9 dígitos que empiezan por 8 o 9.
+    2. La decisión registrada en 'terceros' ({identificación: "PJ" | "PN"}).
+    3. El nombre normalizado contra 'patron_pj' (por defecto el del catálogo),
+       evaluado una vez por nombre distinto. Estas decisiones se agregan a
+       'terceros' para la próxima vez.
+    """
+    es_pj = np.zeros(len(nombres_tercero), dtype=bool)
+    por_nombre = np.ones(len(nombres_tercero), dtype=bool)
+    if identificaciones is not None:
+        ids = digitos_identificacion(identificaciones)
+        nit_pj = (ids.str.len() == 9) & ids.str[:1].isin(["8", "9"])
+        registrado = ids.map(terceros or {}).where(~nit_pj)
+        es_pj = nit_pj.to_numpy(dtype=bool) | (registrado == "PJ").to_numpy(dtype=bool)
+        por_nombre = (~nit_pj & registrado.isna()).to_numpy(dtype=bool)
+
+    if por_nombre.any():
+        patron_pj = patron_pj or cargar_catalogo()["patron_pj"]
+        codigos, textos = factorizar_normalizado(nombres_tercero[por_nombre])
+        coincide = pd.Series(textos, dtype=object).str.contains(patron_pj).to_numpy(dtype=bool)
+        es_pj[por_nombre] = coincide[codigos]
+        if identificaciones is not None and terceros is not None:
+            nuevos = por_nombre & (ids != "").to_numpy(dtype=bool)
+            terceros.update(zip(ids[nuevos].tolist(), np.where(es_pj[nuevos], "PJ", "PN").tolist()))
+    return pd.Series(es_pj, index=nombres_tercero.index)
+
+
+# ==========================================================
+# 🧾 CONCEPTOS DE RETENCIÓN (CUENTA 2365)
+# ==========================================================
+def clasificar_conceptos(raw, catalogo=None, auxiliares=None, terceros=None):
+    """
+    Reparte en una sola pasada las cuentas auxiliares 2365 del balance entre los
+    conceptos del catálogo (por defecto cargar_catalogo()). Devuelve una lista
+    con un DataFrame por concepto, en el orden del catálogo, con las columnas
+    del balance más '__retencion__' (crédito - débito) y 'es_pj'. Una cuenta
+    cuyo nombre encaja en varios conceptos aparece en cada uno de ellos.
+
+    Los nombres de cuenta y de tercero se normalizan una vez por valor distinto
+    y los patrones se evalúan sobre esos valores, no fila por fila.
+    'auxiliares' es la máscara de mascara_auxiliar(raw) si ya se calculó y
+    'terceros' el registro PJ/PN de mascara_persona_juridica().
+    """
+    catalogo = catalogo or cargar_catalogo()
+    if auxiliares is None:
+        auxiliares = mascara_auxiliar(raw)
+    codigos, terceros_norm = factorizar_normalizado(raw["Nombre tercero"])
+    excluido = _coincidencias(terceros_norm, catalogo["terceros_excluidos"])[codigos]
+    base = (
+        auxiliares.to_numpy(dtype=bool)
+        & raw["Código cuenta contable"].astype(str).str.startswith("2365").to_numpy(dtype=bool)
+        & ~excluido
+    )
+    candidatas = raw[base].copy()
+    candidatas["__retencion__"] = (
+        pd.to_numeric(candidatas["Movimiento crédito"], errors="coerce").fillna(0)
+        - pd.to_numeric(candidatas["Movimiento débito"], errors="coerce").fillna(0)
+    )
+    candidatas["es_pj"] = mascara_persona_juridica(
+        candidatas["Nombre tercero"], candidatas["Identificación"], terceros, catalogo["patron_pj"]
+    )
+
+    codigos, nombres = factorizar_normalizado(candidatas["Nombre cuenta contable"])
+    return [candidatas[_coincidencias(nombres, c["patrones"])[codigos]] for c in catalogo["conceptos"]]
+
+
+# ==========================================================
+# 🧮 FÓRMULAS DEL FORMULARIO 350
+# ==========================================================
+PATRON_CELDA = re.compile(r"(\$?[A-Z]+)(\d+)")
+
+
+def valor_formulario_350(valor, desplazamiento=1):
+    """
+    Valor de una celda de Detalle_350 tal como queda en Formulario_350, que va
+    'desplazamiento' filas más abajo: las fórmulas con las referencias corridas,
+    entre paréntesis y redondeadas al múltiplo de mil; los números distintos de
+    cero como =MROUND(v,1000); lo demás sin cambios.
+    """
+    if isinstance(valor, str) and valor.strip().startswith("="):
+        formula = PATRON_CELDA.sub(lambda m: f"{m.group(1)}{int(m.group(2)) + desplazamiento}", valor)
+        contenido = formula[1:].strip()
+        if not (contenido.startswith("(") and contenido.endswith(")")):
+            formula = f"=({contenido})"
+        contenido = formula[1:].strip()
+        if "MROUND" not in contenido.upper():
+            formula = f"=MROUND({contenido},1000)"
+        return formula
+    if isinstance(valor, (int, float)) and valor != 0:
+        return f"=MROUND({valor},1000)"
+    return valor
@@ -0,0 +1,70 @@
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import pytest
+from almacen_utils import (
+    cargar_abiertas, cargar_perfiles, cargar_terceros, conectar, guardar_perfil, guardar_terceros,
+    periodo_posterior, registrar_periodo
+)
+
+
+def partidas(*filas):
+    return pd.DataFrame(filas, columns=["fecha", "descripcion", "centavos"])
+
+
+def test_reprocesar_enero_despues_de_febrero(tmp_path):
+    con = conectar(str(tmp_path / "almacen.sqlite3"))
+    cheque = partidas((pd.Timestamp("2025-01-20"), "cheque 123", -100000))
+    registrar_periodo(con, "A", "2025-01", [], cheque, partidas())
+
+    # Febrero cierra el cheque de enero
+    abiertas_feb, _ = cargar_abiertas(con, "A", "2025-02")
+    registrar_periodo(con, "A", "2025-02", (-abiertas_feb.index).tolist(), partidas(), partidas())
+    assert cargar_abiertas(con, "A", "2025-03")[0].empty
+
+    # Reprocesar enero no puede reabrir lo que febrero ya cerró
+    assert periodo_posterior(con, "A", "2025-01") == "2025-02"
+    with pytest.raises(ValueError):
+        registrar_periodo(con, "A", "2025-01", [], cheque, partidas())
+    assert cargar_abiertas(con, "A", "2025-03")[0].empty
+    assert len(cargar_abiertas(con, "A", "2025-02")[0]) == 1
+    con.close()
+
+
+def test_reprocesar_el_ultimo_mes_no_duplica(tmp_path):
+    con = conectar(str(tmp_path / "almacen.sqlite3"))
+    cheque = partidas((pd.Timestamp("2025-01-20"), "cheque 123", -100000))
+    registrar_periodo(con, "A", "2025-01", [], cheque, partidas())
+    registrar_periodo(con, "A", "2025-01", [], cheque, partidas())
+
+    assert periodo_posterior(con, "A", "2025-01") is None
+    assert len(cargar_abiertas(con, "A", "2025-02")[0]) == 1
+    con.close()
+
+
+def _guardar_perfiles(ruta, proceso, cantidad=20):
+    for k in range(cantidad):
+        guardar_perfil(f"firma_{proceso}_{k}", {"fila_encabezado": proceso}, ruta)
+
+
+def test_perfiles_guardados_en_paralelo_no_se_pierden(tmp_path):
+    ruta = str(tmp_path / "perfiles_extracto.json")
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        list(pool.map(_guardar_perfiles, [ruta] * 4, range(4)))
+
+    assert len(cargar_perfiles(ruta)) == 4 * 20
+
+
+def _guardar_terceros(ruta, proceso, cantidad=20):
+    for k in range(cantidad):
+        guardar_terceros({f"{proceso}{k:04d}": "PN"}, ruta)
+
+
+def test_terceros_guardados_en_paralelo_no_se_pierden(tmp_path):
+    ruta = str(tmp_path / "terceros_retefuente.json")
+    guardar_terceros({"900123456": "PJ"}, ruta)
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        list(pool.map(_guardar_terceros, [ruta] * 4, range(1, 5)))
+
+    terceros = cargar_terceros(ruta)
+    assert len(terceros) == 1 + 4 * 20
+    assert terceros["900123456"] == "PJ"
@@ -0,0 +1,192 @@
+import io
+import pandas as pd
+from almacen_utils import conectar, registrar_periodo
+from conciliacion_utils import (
+    cargar_arrastre, cargar_extracto, consultar_partidas, emparejar_archivos_por_cuenta, emparejar_con_tolerancia,
+    emparejar_por_referencia, extraer_referencias, parsear_fechas, parsear_montos,
+)
+
+
+def test_tolerancia_con_banda_de_montos_densa():
+    # 100 partidas del extracto con el mismo monto (dentro de la tolerancia);
+    # solo la última cae en la ventana de ±3 días de la partida contable.
+    contab = pd.DataFrame({"centavos": [100000], "fecha": pd.to_datetime(["2024-03-31"])})
+    banco = pd.DataFrame({
+        "centavos": [100050] * 100,
+        "fecha": pd.date_range("2024-01-01", "2024-03-31", periods=100),
+    })
+
+    pares = emparejar_con_tolerancia(contab, banco, tolerancia=1.0, dias=3)
+
+    assert pares["idx_contab"].tolist() == [0]
+    assert pares["idx_banco"].tolist() == [99]
+
+
+def test_tolerancia_prefiere_la_fecha_mas_cercana_en_cada_monto():
+    contab = pd.DataFrame({"centavos": [100000], "fecha": pd.to_datetime(["2024-02-15"])})
+    banco = pd.DataFrame({
+        "centavos": [100050] * 60 + [99980] * 60,
+        "fecha": list(pd.date_range("2024-01-01", periods=60)) * 2,
+    })
+
+    pares = emparejar_con_tolerancia(contab, banco, tolerancia=1.0, dias=0, max_candidatos=2)
+
+    assert banco.loc[pares["idx_banco"], "centavos"].tolist() == [99980]
+    assert banco.loc[pares["idx_banco"], "fecha"].tolist() == [pd.Timestamp("2024-02-15")]
+
+
+def test_arrastre_respeta_la_antiguedad_maxima(tmp_path):
+    ruta = str(tmp_path / "almacen.sqlite3")
+    con = conectar(ruta)
+    cheque_viejo = pd.DataFrame({
+        "fecha": [pd.Timestamp("2023-03-10")], "descripcion": ["cheque 1"], "centavos": [-100000000],
+    })
+    registrar_periodo(con, "A", "2023-03", [], cheque_viejo, cheque_viejo.iloc[:0])
+    con.close()
+
+    contab = pd.DataFrame({
+        "fecha": pd.to_datetime(["2025-03-05"]), "descripcion": ["pago"], "centavos": [-100000000],
+    }).astype({"descripcion": "category"})
+    banco = contab.copy()
+
+    _, _, pares, _ = cargar_arrastre(contab, banco, "A", "2025-03", ruta, dias_maximos=180)
+    assert pares.empty
+
+    _, _, pares, _ = cargar_arrastre(contab, banco, "A", "2025-03", ruta, dias_maximos=800)
+    # El cheque arrastrado (índice negativo) se concilia con el movimiento bancario nuevo
+    assert len(pares) == 1
+    assert pares["idx_contab"].iloc[0] < 0
+    assert pares["idx_banco"].iloc[0] == 0
+
+
+def test_montos_en_formatos_locales():
+    col = pd.Series(["1.234,56", "1,234.56", "(1.000)", "$ -500", "", None, "abc", "45.000"], dtype=object)
+
+    montos, no_convertidas = parsear_montos(col)
+
+    assert montos.iloc[:4].tolist() == [1234.56, 1234.56, -1000.0, -500.0]
+    assert montos.iloc[4:7].isna().all()
+    assert montos.iloc[7] == 45000.0
+    # Las celdas vacías no cuentan como errores; el texto basura sí
+    assert no_convertidas == 1
+
+
+def test_fechas_dia_primero_iso_y_serial():
+    esperadas = pd.to_datetime(["2024-01-31", "2024-02-05"]).tolist()
+
+    fechas, descripcion = parsear_fechas(pd.Series(["31/01/2024", "05/02/2024"]))
+    # 05/02 es ambiguo por sí solo; 31/01 fija el orden día/mes para toda la columna
+    assert fechas.tolist() == esperadas
+    assert descripcion == "DD/MM/YYYY"
+
+    fechas, descripcion = parsear_fechas(pd.Series(["2024-01-31", "2024-02-05"]))
+    assert fechas.tolist() == esperadas
+    assert descripcion == "YYYY-MM-DD"
+
+    fechas, descripcion = parsear_fechas(pd.Series([45322, 45327]))
+    assert fechas.tolist() == esperadas
+    assert descripcion == "serial de Excel"
+
+
+def test_fechas_mezcla_de_serial_y_texto():
+    fechas, descripcion = parsear_fechas(pd.Series([45322, "05/02/2024", None], dtype=object))
+
+    assert fechas.iloc[:2].tolist() == pd.to_datetime(["2024-01-31", "2024-02-05"]).tolist()
+    assert pd.isna(fechas.iloc[2])
+    assert "serial de Excel" in descripcion
+
+
+def test_referencias_repetidas_no_se_emparejan():
+    contab = pd.DataFrame({
+        "descripcion": ["pago factura 1234", "pago factura 1234", "ref 0555 proveedor", "cheque 777"],
+        "centavos": [100, 100, 200, 300],
+    }, index=[10, 11, 12, 13])
+    banco = pd.DataFrame({
+        "descripcion": ["transf 1234", "ref 555", "chq 777", "chq 777"],
+        "centavos": [100, 200, 300, 300],
+    })
+
+    referencias = extraer_referencias(contab["descripcion"])
+    assert referencias["referencia"].tolist() == ["1234", "1234", "555", "777"]
+
+    pares = emparejar_por_referencia(contab, banco)
+
+    # 1234 se repite en contabilidad y 777 en el extracto: solo 555 es inequívoca
+    assert pares["idx_contab"].tolist() == [12]
+    assert pares["idx_banco"].tolist() == [1]
+
+
+def test_consulta_con_filtros_vacios_y_pagina_fuera_de_rango():
+    df = pd.DataFrame({
+        "fecha": pd.date_range("2024-01-01", periods=5),
+        "descripcion": pd.Series(["pago a", "pago b", "cobro", None, "pago c"], dtype="category"),
+        "monto": [10.0, -20.0, 30.0, 40.0, -50.0],
+    })
+
+    todo = consultar_partidas(df, texto="", pagina=1, tamano_pagina=2)
+    assert todo["filas"] == 5
+    assert todo["paginas"] == 3
+    assert todo["suma"] == 10.0
+
+    # Una página más allá del final devuelve la última
+    ultima = consultar_partidas(df, pagina=99, tamano_pagina=2)
+    assert ultima["pagina"].index.tolist() == [4]
+
+    vacia = consultar_partidas(df, texto="no existe", pagina=3)
+    assert vacia["filas"] == 0
+    assert vacia["paginas"] == 1
+    assert vacia["pagina"].empty
+    assert vacia["suma"] == 0.0
+
+    pagos = consultar_partidas(df, texto="PAGO", monto_min=15)
+    assert pagos["pagina"].index.tolist() == [1, 4]
+
+
+def test_extracto_con_los_finales_de_dos_cuentas_es_ambiguo():
+    cuentas = [("aux_a.xlsx", "1234-5678-1234"), ("aux_b.xlsx", "9999-5678"), ("aux_c.xlsx", "4321")]
+    extractos = ["extracto 1234 5678.xlsx", "cta 4321 enero 2024.xlsx"]
+
+    parejas, sin_pareja = emparejar_archivos_por_cuenta(cuentas, extractos)
+
+    assert parejas == [(2, 1)]
+    motivos = dict(sin_pareja)
+    assert motivos["aux_a.xlsx"] == "El extracto extracto 1234 5678.xlsx coincide con varias cuentas"
+    assert motivos["aux_b.xlsx"] == "El extracto extracto 1234 5678.xlsx coincide con varias cuentas"
+
+
+def test_extracto_excel_con_monto_no_numerico_fuera_de_la_muestra(tmp_path, monkeypatch):
+    # Las primeras filas (la muestra del perfil) tienen montos numéricos; la fila 25 no
+    valores = [1000.0] * 30
+    valores[25] = "pendiente"
+    extracto = pd.DataFrame({
+        "Fecha": pd.date_range("2024-01-01", periods=30).strftime("%d/%m/%Y"),
+        "Descripción": [f"pago {i}" for i in range(30)],
+        "Valor": valores,
+    })
+    archivo = io.BytesIO()
+    extracto.to_excel(archivo, index=False)
+    archivo.name = "extracto.xlsx"
+    ruta_perfiles = str(tmp_path / "perfiles.json")
+    tipos_leidos = []
+    read_excel = pd.read_excel
+
+    def read_excel_registrando(*args, **kwargs):
+        tipos_leidos.append(kwargs.get("dtype"))
+        return read_excel(*args, **kwargs)
+
+    monkeypatch.setattr(pd, "read_excel", read_excel_registrando)
+
+    df_banco, info = cargar_extracto(archivo, ruta_perfiles=ruta_perfiles)
+
+    # Primero con los tipos de la muestra; al fallar el monto, sin tipos fijos
+    assert tipos_leidos == [{"Descripción": "string", "Valor": "float64"}, {}]
+
+    assert info["registros"] == 30
+    assert len(df_banco) == 29
+    assert info["montos_no_convertidos"] == 1
+    assert info["perfil"] == "nuevo"
+
+    # El perfil registrado conserva los tipos de la muestra y la relectura sigue funcionando
+    df_banco, info = cargar_extracto(archivo, ruta_perfiles=ruta_perfiles)
+    assert info["perfil"] == "conocido"
+    assert len(df_banco) == 29
@@ -0,0 +1,69 @@
+import pandas as pd
+from retefuente_utils import (
+    cargar_catalogo, clasificar_conceptos, compilar_patrones, mascara_persona_juridica,
+    valor_formulario_350,
+)
+
+
+def _balance(filas):
+    return pd.DataFrame(filas, columns=[
+        "Nivel", "Transaccional", "Código cuenta contable", "Nombre cuenta contable",
+        "Nombre tercero", "Identificación", "Movimiento crédito", "Movimiento débito",
+    ])
+
+
+def test_clasificar_cuenta_en_dos_conceptos_y_terceros_excluidos():
+    catalogo = dict(cargar_catalogo())
+    catalogo["conceptos"] = [
+        {"nombre": "Honorarios", "patrones": compilar_patrones(["honorario"]), "tasas": (0.11, 0.10)},
+        {"nombre": "Servicios", "patrones": compilar_patrones(["servicio"]), "tasas": (0.04, 0.06)},
+    ]
+    raw = _balance([
+        ["Auxiliar", "No", "23651501", "Retención Honorarios y Servicios", "Pedro Pérez", "1020304", 500, 0],
+        ["Auxiliar", "No", "23652501", "Retención servicios", "Aseo Total SAS", "900123456-1", 300, 100],
+        ["Auxiliar", "No", "23652501", "Retención servicios", "DIAN", "800197268", 999, 0],
+        ["Mayor", "No", "2365", "Retención servicios", "Pedro Pérez", "1020304", 999, 0],
+        ["Auxiliar", "No", "23802001", "Honorarios por pagar", "Pedro Pérez", "1020304", 999, 0],
+    ])
+
+    honorarios, servicios = clasificar_conceptos(raw, catalogo)
+
+    # La cuenta que nombra los dos conceptos aparece en ambos
+    assert honorarios.index.tolist() == [0]
+    assert servicios.index.tolist() == [0, 1]
+    assert servicios["__retencion__"].tolist() == [500, 200]
+    assert servicios["es_pj"].tolist() == [False, True]
+
+
+def test_persona_juridica_por_nit_registro_y_nombre():
+    nombres = pd.Series(["Juan Gómez", "Inversiones Gómez", "Inversiones Gómez", "Comercial Andina SAS", "Ana Ruiz"])
+    identificaciones = pd.Series(["900123456-7", "1020304", "79555111", "123456", ""])
+    # El registro dice PN para un nombre con patrón de PJ y para un NIT de
+    # persona jurídica; el NIT manda sobre el registro
+    terceros = {"1020304": "PN", "900123456": "PN"}
+
+    es_pj = mascara_persona_juridica(nombres, identificaciones, terceros)
+
+    assert es_pj.tolist() == [True, False, True, True, False]
+    # Solo las decisiones por nombre con identificación se agregan al registro
+    assert terceros == {"1020304": "PN", "900123456": "PN", "79555111": "PJ", "123456": "PJ"}
+
+
+def test_valores_del_formulario_350():
+    assert valor_formulario_350("=F10+G10") == "=MROUND((F11+G11),1000)"
+    assert valor_formulario_350("=(F10)") == "=MROUND((F11),1000)"
+    assert valor_formulario_350(5) == "=MROUND(5,1000)"
+    assert valor_formulario_350(1234.5) == "=MROUND(1234.5,1000)"
+    assert valor_formulario_350(0) == 0
+    assert valor_formulario_350("Honorarios") == "Honorarios"
+    assert valor_formulario_350(None) is None
+
+
+def test_subtotales_del_formulario_350_siguen_a_sus_filas():
+    # Los subtotales suman filas de Detalle_350 que en Formulario_350 quedan una más abajo
+    assert valor_formulario_350("=SUM(F10:F12)") == "=MROUND((SUM(F11:F13)),1000)"
+    assert valor_formulario_350("=F8+F15+F22", desplazamiento=2) == "=MROUND((F10+F17+F24),1000)"
+    # Una fila absoluta no se corre
+    assert valor_formulario_350("=$F$10*0.11") == "=MROUND(($F$10*0.11),1000)"
+    # Lo que ya está redondeado no se vuelve a redondear
+    assert valor_formulario_350("=MROUND(F10,1000)") == "=(MROUND(F11,1000))"
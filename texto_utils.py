@@ -0,0 +1,43 @@
+import functools
+import unicodedata
+import numpy as np
+import pandas as pd
+
+# ==========================================================
+# 🔤 NORMALIZACIÓN DE TEXTO
+# ==========================================================
+# Una sola normalización para todas las páginas: minúsculas, sin espacios en
+# los extremos y sin tildes (NFKD sin marcas combinantes, que además convierte
+# espacios duros y caracteres como 'º' a su forma simple). Las columnas se
+# normalizan por valor distinto: nombres de cuenta y de tercero se repiten
+# mucho, y la caché compartida evita repetir el trabajo entre archivos.
+
+TAMANO_CACHE_TEXTOS = 200_000
+
+
+@functools.lru_cache(maxsize=TAMANO_CACHE_TEXTOS)
+def _normalizar(texto):
+    texto = unicodedata.normalize("NFKD", texto.strip().lower())
+    return "".join(ch for ch in texto if not unicodedata.combining(ch))
+
+
+def normalizar_texto(valor) -> str:
+    """Normaliza un valor (minúsculas, sin tildes ni espacios en los extremos); "" si está vacío."""
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return ""
+    return _normalizar(str(valor))
+
+
+def factorizar_normalizado(serie):
+    """
+    (códigos, textos): normalizar_texto de cada valor distinto de la columna.
+    Los vacíos tienen código -1, que apunta al último texto: "".
+    """
+    codigos, unicos = pd.factorize(serie)
+    return codigos, [normalizar_texto(u) for u in unicos] + [""]
+
+
+def normalizar_serie(serie):
+    """normalizar_texto de cada valor de la columna, calculado una sola vez por valor distinto."""
+    codigos, textos = factorizar_normalizado(serie)
+    return pd.Series(np.array(textos, dtype=object)[codigos], index=serie.index)